@@ -1,32 +1,118 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, send_from_directory
+from flask import Flask, Request, current_app, render_template, request, redirect, url_for, flash, session, send_file, jsonify, abort
+import click
 import os
-from modules.pdf_utils import extract_text_from_pdf
-from modules.ai_utils import generate_ai_output
-from modules.db_utils import init_db, save_quiz_score, get_user_scores
+import tempfile
+import time
+from config import Config, use_config
+from modules.generation import generate_study_page, estimate_prompt_tokens, request_cache_key, find_cached_page
+from modules.job_queue import submit_job, get_job, find_job, queue_stats, QueueFullError
+from modules.rate_limit import admit, RateLimitedError
+from modules.job_stream import read_stream
+from modules.cache_utils import cache_stats
+from modules.page_store import resolve_page, touch_page, user_pages, enforce_retention, PAGE_STORE_MAX_BYTES
+from modules.llm_client import client_stats
+from modules.metrics import inc, observe, stage, start_trace, end_trace, render as render_metrics
+from modules.upload_store import save_upload, UploadError
+from modules.compression import content_etag, pick_variant
+from modules.quiz_utils import grade_page_submissions
+from modules.db_utils import init_db, close_db_connection, save_quiz_score, get_user_scores, get_user_stats, rebuild_quiz_stats
+from modules.search_index import search, start_indexer, index_materials
+from modules.bulk_generate import bulk_generate, format_report, BULK_CONCURRENCY, DEFAULT_KINDS
 from modules.auth import register_user, login_user, logout_user, login_required
-from dotenv import load_dotenv
-from werkzeug.utils import secure_filename
-import uuid
-from datetime import datetime
 
-load_dotenv()
+class UploadRequest(Request):
+    """Spool uploaded files straight to an unnamed temp file instead of up to 500 KB in memory."""
 
-app = Flask(__name__)
-app.secret_key = os.getenv("SECRET_KEY", "default_secret_key")
-app.config['UPLOAD_FOLDER'] = 'uploads'
-app.config['OUTPUT_FOLDER'] = 'outputs'
-app.config['GENERATED_FOLDER'] = 'generated'
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-os.makedirs(app.config['OUTPUT_FOLDER'], exist_ok=True)
-os.makedirs(app.config['GENERATED_FOLDER'], exist_ok=True)
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.TemporaryFile('wb+')
 
-init_db()
+# Generated pages are immutable, so browsers may keep them for a year
+GENERATED_MAX_AGE = 365 * 24 * 3600
+
+SUBJECT_TEMPLATES = {
+    'data_structure': 'subjects/data_structure.html',
+    'discrete_math': 'subjects/discrete_math.html',
+    'micro_assembly': 'subjects/micro_assembly.html',
+    'operations_research': 'subjects/operations_research.html',
+    'systems_analysis': 'subjects/systems_analysis.html',
+    'web_programming': 'subjects/web_programming.html'
+}
+
+def create_app(config=Config):
+    """
+    Build the application from a config class (Config, DevelopmentConfig,
+    ProductionConfig) or mapping, which then also configures the database,
+    LLM client, job queue and rate limits. Safe to call from gunicorn --preload:
+    it opens no connections or threads that would be inherited by workers.
+    """
+    app = Flask(__name__)
+    app.request_class = UploadRequest
+    # MAX_CONTENT_LENGTH makes Werkzeug reject oversized bodies before parsing them
+    if isinstance(config, dict):
+        app.config.from_object(Config)
+        app.config.update(config)
+    else:
+        app.config.from_object(config)
+    # Modules read their settings from this config from now on (config.get_setting)
+    use_config(app.config)
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    os.makedirs(app.config['OUTPUT_FOLDER'], exist_ok=True)
+    os.makedirs(app.config['GENERATED_FOLDER'], exist_ok=True)
+
+    init_db()
+    # Workers forked from a preloaded parent must open their own connection
+    close_db_connection()
+
+    app.before_request(start_request_trace)
+    app.before_request(start_background_indexer)
+    app.after_request(record_request_metrics)
+    _register_routes(app)
+    app.register_error_handler(404, not_found)
+    app.register_error_handler(413, too_large)
+    app.register_error_handler(500, server_error)
+    app.cli.command('rebuild-stats')(rebuild_stats_command)
+    app.cli.command('index-materials')(index_materials_command)
+    app.cli.command('bulk-generate')(bulk_generate_command)
+    app.cli.command('prune-pages')(prune_pages_command)
+    return app
+
+def _register_routes(app):
+    app.add_url_rule('/', 'index', index)
+    app.add_url_rule('/login', 'login', login, methods=['GET', 'POST'])
+    app.add_url_rule('/register', 'register', register, methods=['GET', 'POST'])
+    app.add_url_rule('/logout', 'logout', logout)
+    app.add_url_rule('/dashboard', 'dashboard', dashboard)
+    app.add_url_rule('/api/stats', 'api_stats', api_stats)
+    app.add_url_rule('/subjects/<subject_name>', 'subject', subject)
+    app.add_url_rule('/subjects/<subject_name>/search', 'subject_search', subject_search)
+    app.add_url_rule('/ai_tool/upload', 'ai_tool', ai_tool)
+    app.add_url_rule('/process', 'process', process, methods=['POST'])
+    app.add_url_rule('/jobs/<job_id>', 'job_page', job_page)
+    app.add_url_rule('/jobs/<job_id>/status', 'job_status', job_status)
+    app.add_url_rule('/jobs/stats', 'job_stats', job_stats)
+    app.add_url_rule('/metrics', 'metrics', metrics)
+    app.add_url_rule('/generated/<filename>', 'view_generated', view_generated)
+    app.add_url_rule('/submit_quiz', 'submit_quiz', submit_quiz, methods=['POST'])
+
+def start_request_trace():
+    start_trace(f"{request.method} {request.path}")
+
+def start_background_indexer():
+    # Started lazily so a preloaded gunicorn master never owns the thread
+    start_indexer(current_app.config['DATA_FOLDER'])
+
+def record_request_metrics(response):
+    elapsed = end_trace()
+    # The endpoint name, not the path, so label values stay bounded
+    endpoint = request.endpoint or 'unmatched'
+    inc('http_requests_total', method=request.method, endpoint=endpoint, status=response.status_code)
+    if elapsed is not None:
+        observe('http_request_seconds', elapsed, endpoint=endpoint)
+    return response
 
-@app.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         username = request.form.get('username')
@@ -38,7 +124,6 @@ def login():
             flash('Invalid credentials', 'error')
     return render_template('login.html')
 
-@app.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
         username = request.form.get('username')
@@ -51,98 +136,256 @@ def register():
             flash('Username already exists', 'error')
     return render_template('login.html')
 
-@app.route('/logout')
 def logout():
     logout_user()
     flash('Logged out successfully', 'success')
     return redirect(url_for('index'))
 
-@app.route('/dashboard')
 @login_required
 def dashboard():
     scores = get_user_scores(session['user_id'])
-    return render_template('dashboard.html', scores=scores)
+    stats = get_user_stats(session['user_id'])
+    pages = user_pages(session['user_id'])
+    return render_template('dashboard.html', scores=scores, stats=stats, pages=pages)
+
+@login_required
+def api_stats():
+    return jsonify(get_user_stats(session['user_id']))
 
-@app.route('/subjects/<subject_name>')
 @login_required
 def subject(subject_name):
-    template_map = {
-        'data_structure': 'subjects/data_structure.html',
-        'discrete_math': 'subjects/discrete_math.html',
-        'micro_assembly': 'subjects/micro_assembly.html',
-        'operations_research': 'subjects/operations_research.html',
-        'systems_analysis': 'subjects/systems_analysis.html',
-        'web_programming': 'subjects/web_programming.html'
-    }
-    template = template_map.get(subject_name)
+    template = SUBJECT_TEMPLATES.get(subject_name)
     if template:
         return render_template(template, subject=subject_name)
     return redirect(url_for('dashboard'))
 
-@app.route('/ai_tool/upload')
+@login_required
+def subject_search(subject_name):
+    """Ranked snippets from the subject's lectures, labs and summaries matching ?q=."""
+    if subject_name not in SUBJECT_TEMPLATES:
+        abort(404)
+    query = request.args.get('q', '').strip()
+    start = time.perf_counter()
+    results = search(subject_name, query)
+    return jsonify({
+        'subject': subject_name,
+        'query': query,
+        'results': results,
+        'took_ms': round((time.perf_counter() - start) * 1000, 2),
+    })
+
 @login_required
 def ai_tool():
     return render_template('ai_tool/upload.html')
 
-@app.route('/process', methods=['POST'])
 @login_required
 def process():
+    # Reject from the declared length alone, before reading any of the body
+    if request.content_length and request.content_length > current_app.config['MAX_CONTENT_LENGTH']:
+        abort(413)
+    
     user_text = request.form.get('user_text')
     pdf_file = request.files.get('pdf_file')
     
-    if not user_text and not pdf_file:
+    if not (user_text and user_text.strip()) and not (pdf_file and pdf_file.filename):
         flash("Please upload a file or enter text.", 'error')
         return redirect(url_for('ai_tool'))
     
-    if pdf_file and pdf_file.filename:
-        filename = secure_filename(pdf_file.filename)
-        pdf_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        pdf_file.save(pdf_path)
-        user_text = extract_text_from_pdf(pdf_path)
+    # Each user has a request and prompt-token budget, so one cannot use up the LLM
+    # quota; checked before the upload is stored so an over-quota user costs no disk
+    try:
+        admit(session['user_id'])
+    except RateLimitedError as e:
+        flash(f"You are generating pages faster than your quota allows. Please try again in "
+              f"{e.retry_after} seconds.", 'error')
+        return redirect(url_for('ai_tool'))
     
-    # Generate HTML from AI
-    html_output = generate_ai_output(user_text)
+    pdf_path = None
+    if pdf_file and pdf_file.filename:
+        # Stored by content hash, so identical uploads share one file and one extraction
+        try:
+            with stage('upload_save'):
+                _, pdf_path = save_upload(pdf_file, current_app.config['UPLOAD_FOLDER'],
+                                          max_size=current_app.config['MAX_CONTENT_LENGTH'])
+        except UploadError as e:
+            flash(str(e), 'error')
+            return redirect(url_for('ai_tool'))
     
-    # Create unique filename with timestamp
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    unique_id = str(uuid.uuid4())[:8]
-    filename = f"study_page_{timestamp}_{unique_id}.html"
+    # Pages generated before, and requests this user already has in flight, skip the
+    # queue; only input that must be extracted first has no key yet
+    folder = current_app.config['GENERATED_FOLDER']
+    with stage('cache_lookup'):
+        key = request_cache_key(user_text, pdf_path)
+        cached = key and find_cached_page(key, folder, session['user_id'])
+        pending = key and not cached and find_job(session['user_id'], key)
+    if cached:
+        return redirect(url_for('view_generated', filename=cached))
+    if pending:
+        return redirect(url_for('job_page', job_id=pending))
     
-    # Save to generated folder
-    output_path = os.path.join(app.config['GENERATED_FOLDER'], filename)
-    with open(output_path, 'w', encoding='utf-8') as f:
-        f.write(html_output)
+    # Extraction and generation run on a worker thread; the browser polls the job.
+    # Its tokens are charged there, and only if it misses the generation cache
+    try:
+        job_id = submit_job(session['user_id'], generate_study_page,
+                            user_text, pdf_path, folder, session['user_id'],
+                            cost=estimate_prompt_tokens(user_text, pdf_path), key=key)
+    except QueueFullError:
+        flash("The generator is busy right now. Please try again in a minute.", 'error')
+        return redirect(url_for('ai_tool'))
     
-    # Redirect to view the generated HTML
-    return redirect(url_for('view_generated', filename=filename))
+    return redirect(url_for('job_page', job_id=job_id))
+
+def _get_user_job(job_id):
+    job = get_job(job_id)
+    if job is None or job['user_id'] != session['user_id']:
+        abort(404)
+    return job
+
+@login_required
+def job_page(job_id):
+    job = _get_user_job(job_id)
+    if job['status'] == 'done':
+        return redirect(url_for('view_generated', filename=job['filename']))
+    return render_template('ai_tool/processing.html', job=job)
+
+@login_required
+def job_status(job_id):
+    """
+    A job's status, plus the model output generated past ?offset= while it
+    runs. Polled by the processing page: a short request each time, so a
+    waiting student never holds a server thread, and answered by whichever
+    process the poll reaches.
+    """
+    job = _get_user_job(job_id)
+    result = {'id': job['id'], 'status': job['status'], 'error': job['error']}
+    if job['status'] == 'done':
+        result['url'] = url_for('view_generated', filename=job['filename'])
+    elif job['status'] == 'running':
+        offset = request.args.get('offset', 0, type=int)
+        result['output'], result['offset'] = read_stream(job_id, offset)
+    return jsonify(result)
+
+@login_required
+def job_stats():
+    return jsonify(queue_stats())
+
+def metrics():
+    """
+    Prometheus scrape endpoint: request, stage, LLM and cache metrics of all
+    server processes, plus gauges of the process that served the scrape.
+    """
+    # Behind the reverse proxy every client looks local, so the address proves nothing
+    token = current_app.config['METRICS_TOKEN']
+    if token:
+        if request.headers.get('Authorization') != f"Bearer {token}":
+            abort(404)
+    elif not current_app.debug:
+        abort(404)
+
+    jobs = queue_stats()
+    cache = cache_stats()
+    llm = client_stats()
+    gauges = {
+        'generation_cache_entries': (cache['entries'], "Pages in the generation cache."),
+        'generation_cache_bytes': (cache['bytes'], "Bytes of cached generated pages."),
+    }
+    process_gauges = {
+        'job_queue_depth': (jobs['depth'], "Jobs waiting for a worker."),
+        'job_queue_running': (jobs['running'], "Jobs being run right now."),
+        'job_queue_rejected': (jobs['rejected'], "Jobs rejected because the queue was full."),
+        'llm_breaker_open': (int(llm['breaker_state'] != 'closed'), "1 while the DeepSeek circuit breaker is open or half-open."),
+        'llm_connection_reuse_ratio': (llm['connection_reuse_ratio'], "Share of DeepSeek requests sent on a reused connection."),
+    }
+    return render_metrics(gauges, process_gauges), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
 
-@app.route('/generated/<filename>')
 @login_required
 def view_generated(filename):
-    """Serve generated HTML files inline in the browser."""
-    return send_from_directory(
-        app.config['GENERATED_FOLDER'],
-        filename,
-        mimetype='text/html',
-        as_attachment=False
-    )
-
-@app.route('/submit_quiz', methods=['POST'])
+    """
+    Serve generated HTML files inline in the browser. Pages never change
+    once written, so the precompressed variant is sent with a strong ETag
+    and a long-lived immutable Cache-Control; revalidations get a 304.
+    """
+    path = resolve_page(current_app.config['GENERATED_FOLDER'], filename)
+    if path is None:
+        abort(404)
+    touch_page(filename)
+    
+    variant, encoding = pick_variant(path, request.accept_encodings)
+    etag = content_etag(path)
+    if encoding:
+        # Each representation needs its own strong validator
+        etag = f"{etag}-{encoding}"
+    
+    response = send_file(variant, mimetype='text/html', download_name=filename,
+                         etag=etag, conditional=True, max_age=GENERATED_MAX_AGE)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    # Pages sit behind a login, so shared caches must not store them
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    return response
+
 @login_required
 def submit_quiz():
-    score = request.form.get('score', 0)
+    # Graded here against the question bank; a client-sent score is never trusted
+    page_id = request.form.get('page_id', '')
     subject = request.form.get('subject', 'general')
-    save_quiz_score(session['user_id'], subject, int(score))
-    flash(f'Quiz submitted! Score: {score}', 'success')
+    answers = {k: v for k, v in request.form.items() if k not in ('page_id', 'subject')}
+    correct, total, percentage = grade_page_submissions(page_id, [answers])[0]
+    if not total:
+        flash('This quiz cannot be graded.', 'error')
+        return redirect(url_for('dashboard'))
+    score = round(percentage)
+    save_quiz_score(session['user_id'], subject, score)
+    flash(f'Quiz submitted! {correct}/{total} correct ({score}%)', 'success')
     return redirect(url_for('dashboard'))
 
-@app.errorhandler(404)
 def not_found(e):
     return render_template('errors/404.html'), 404
 
-@app.errorhandler(500)
+def too_large(e):
+    limit = current_app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)
+    flash(f"File is too large. The maximum upload size is {limit} MB.", 'error')
+    return redirect(url_for('ai_tool'))
+
 def server_error(e):
     return render_template('errors/500.html'), 500
 
+def rebuild_stats_command():
+    """Recompute the quiz_stats aggregates from quiz_scores."""
+    count = rebuild_quiz_stats()
+    print(f"Rebuilt quiz stats for {count} user/subject pairs.")
+
+def index_materials_command():
+    """Bring the search index up to date with data/."""
+    counts = index_materials(current_app.config['DATA_FOLDER'])
+    print(f"Indexed {counts['indexed']} files ({counts['unchanged']} unchanged, "
+          f"{counts['removed']} removed, {counts['failed']} failed).")
+
+@click.argument('subjects', nargs=-1)
+@click.option('--kind', 'kinds', multiple=True, default=DEFAULT_KINDS, show_default=True,
+              help="Sub-folders of data/<subject>/ to include.")
+@click.option('--concurrency', default=BULK_CONCURRENCY, show_default=True,
+              help="Pages generated at once. Each long PDF also runs up to AI_MAP_CONCURRENCY "
+                   "chunk summaries in parallel, so up to this many times that LLM calls are in flight.")
+@click.option('--workers', type=int, default=None, help="PDF extraction processes (default: CPU count).")
+@click.option('--manifest', default=None, help="Progress file (default: outputs/bulk_manifest.json).")
+def bulk_generate_command(subjects, kinds, concurrency, workers, manifest):
+    """Generate study pages for every PDF of SUBJECTS (default: all), resuming where the last run stopped."""
+    manifest = manifest or os.path.join(current_app.config['OUTPUT_FOLDER'], 'bulk_manifest.json')
+    report = bulk_generate(current_app.config['DATA_FOLDER'], current_app.config['GENERATED_FOLDER'],
+                           manifest, subjects=subjects, kinds=kinds, concurrency=concurrency,
+                           workers=workers)
+    print(format_report(report))
+
+@click.option('--max-mb', type=int, default=PAGE_STORE_MAX_BYTES // (1024 * 1024), show_default=True,
+              help="Size the generated pages are trimmed to.")
+def prune_pages_command(max_mb):
+    """Delete the least recently viewed generated pages until the rest fit in --max-mb."""
+    count = enforce_retention(current_app.config['GENERATED_FOLDER'], max_mb * 1024 * 1024)
+    print(f"Deleted {count} generated pages.")
+
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    create_app().run(debug=True)
\ No newline at end of file
@@ -0,0 +1,63 @@
+"""
+Cold-start cost of the app: importing app.py, create_app() and the first
+request, each measured in a fresh interpreter. Also lists which heavy
+libraries are already loaded after startup (they should be deferred).
+
+    python -m benchmarks.bench_cold_start --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from benchmarks.bench_upload_memory import REPO_ROOT
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+flask_app = app.create_app()
+created = time.perf_counter()
+loaded = [name for name in ('fitz', 'requests', 'aiohttp', 'brotli') if name in sys.modules]
+response = flask_app.test_client().get('/login')
+first = time.perf_counter()
+print(json.dumps({
+    'import': imported - start,
+    'create_app': created - imported,
+    'first_request': first - created,
+    'status': response.status_code,
+    'loaded': loaded,
+}))
+"""
+
+
+def run_once(workdir):
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT, DATABASE_PATH=os.path.join(workdir, 'bench.sqlite'))
+    out = subprocess.run([sys.executable, '-c', PROBE], cwd=workdir, env=env,
+                         capture_output=True, text=True, check=True)
+    line = [l for l in out.stdout.splitlines() if l.startswith('{')][-1]
+    return json.loads(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        run_once(tmp)  # the first run creates the database; later ones find it ready
+        samples = [run_once(tmp) for _ in range(args.runs)]
+
+    print(f"median of {args.runs} fresh interpreters\n")
+    for key in ('import', 'create_app', 'first_request'):
+        print(f"{key:<14} {statistics.median(s[key] for s in samples) * 1000:8.1f} ms")
+    total = statistics.median(s['import'] + s['create_app'] + s['first_request'] for s in samples)
+    print(f"{'total':<14} {total * 1000:8.1f} ms")
+    print(f"\nheavy modules loaded at startup: {', '.join(samples[-1]['loaded']) or 'none'}")
+
+
+if __name__ == '__main__':
+    main()
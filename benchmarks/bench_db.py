@@ -0,0 +1,121 @@
+"""
+Dashboard-read / quiz-submit throughput under concurrent load, comparing
+the old connect-per-query setup with the shared WAL connection layer.
+
+    python -m benchmarks.bench_db --threads 8 --seconds 5
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from config import use_config
+from modules import db_utils
+
+
+def legacy_connection(path):
+    # What db_utils did before: a fresh rollback-journal connection per query
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def legacy_read(path, user_id):
+    conn = legacy_connection(path)
+    conn.execute(
+        'SELECT subject, score, created_at FROM quiz_scores WHERE user_id = ? ORDER BY created_at DESC LIMIT 10',
+        (user_id,)
+    ).fetchall()
+    conn.close()
+
+
+def legacy_write(path, user_id):
+    conn = legacy_connection(path)
+    conn.execute(
+        'INSERT INTO quiz_scores (user_id, subject, score) VALUES (?, ?, ?)',
+        (user_id, 'data_structure', random.randint(0, 100))
+    )
+    conn.commit()
+    conn.close()
+
+
+def run(label, read, write, threads, seconds, write_ratio, users):
+    counts = {'read': 0, 'write': 0, 'errors': 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def worker():
+        local = {'read': 0, 'write': 0, 'errors': 0}
+        while time.perf_counter() < deadline:
+            user_id = random.randint(1, users)
+            kind = 'write' if random.random() < write_ratio else 'read'
+            try:
+                (write if kind == 'write' else read)(user_id)
+                local[kind] += 1
+            except sqlite3.OperationalError:
+                local['errors'] += 1
+        with lock:
+            for key, value in local.items():
+                counts[key] += value
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+
+    print(f"{label:<22} dashboard {counts['read'] / seconds:9.0f}/s   "
+          f"submit {counts['write'] / seconds:8.0f}/s   errors {counts['errors']}")
+
+
+def seed(path, users, rows):
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        'INSERT INTO quiz_scores (user_id, subject, score) VALUES (?, ?, ?)',
+        ((random.randint(1, users), 'data_structure', random.randint(0, 100)) for _ in range(rows))
+    )
+    conn.commit()
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--rows', type=int, default=200000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = os.path.join(tmp, 'legacy.sqlite')
+        conn = sqlite3.connect(legacy_path)
+        conn.execute('''
+            CREATE TABLE quiz_scores (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                subject TEXT NOT NULL,
+                score INTEGER NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.close()
+        seed(legacy_path, args.users, args.rows)
+
+        shared_path = os.path.join(tmp, 'shared.sqlite')
+        use_config({'DATABASE_PATH': shared_path})
+        db_utils.init_db()
+        seed(shared_path, args.users, args.rows)
+
+        print(f"{args.threads} threads, {args.seconds:g}s, {args.write_ratio:.0%} writes, {args.rows:,} rows\n")
+        run("connect per query", lambda u: legacy_read(legacy_path, u), lambda u: legacy_write(legacy_path, u),
+            args.threads, args.seconds, args.write_ratio, args.users)
+        run("shared WAL + index", db_utils.get_user_scores,
+            lambda u: db_utils.save_quiz_score(u, 'data_structure', random.randint(0, 100)),
+            args.threads, args.seconds, args.write_ratio, args.users)
+
+
+if __name__ == '__main__':
+    main()
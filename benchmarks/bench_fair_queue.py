@@ -0,0 +1,76 @@
+"""
+Queue wait of light users behind one heavy user, first-come-first-served
+vs the fair (deficit round robin) job queue.
+
+One user floods the queue with jobs, then a burst of light users submit
+one job each; simulated jobs sleep in proportion to their token cost.
+
+    python -m benchmarks.bench_fair_queue --heavy-jobs 40 --light-users 10 --workers 4
+"""
+import argparse
+import queue
+import threading
+import time
+from config import get_setting
+from modules.job_queue import FairQueue
+
+SECONDS_PER_1K_TOKENS = 0.02
+
+
+class FifoQueue:
+    def __init__(self):
+        self._queue = queue.Queue()
+
+    def put_nowait(self, user, item, cost=1):
+        self._queue.put_nowait(item)
+
+    def get(self):
+        return self._queue.get()
+
+
+def run(jobs_queue, args):
+    waits = {'heavy': [], 'light': []}
+    done = threading.Semaphore(0)
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            kind, cost, enqueued = jobs_queue.get()
+            with lock:
+                waits[kind].append(time.perf_counter() - enqueued)
+            time.sleep(cost / 1000 * SECONDS_PER_1K_TOKENS)
+            done.release()
+
+    for _ in range(args.workers):
+        threading.Thread(target=worker, daemon=True).start()
+    for _ in range(args.heavy_jobs):
+        jobs_queue.put_nowait('heavy', ('heavy', args.heavy_tokens, time.perf_counter()), args.heavy_tokens)
+    for user in range(args.light_users):
+        jobs_queue.put_nowait(f'light-{user}', ('light', args.light_tokens, time.perf_counter()), args.light_tokens)
+    for _ in range(args.heavy_jobs + args.light_users):
+        done.acquire()
+    return waits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--heavy-jobs', type=int, default=40)
+    parser.add_argument('--heavy-tokens', type=int, default=6000, help="estimated tokens per heavy job")
+    parser.add_argument('--light-users', type=int, default=10)
+    parser.add_argument('--light-tokens', type=int, default=800)
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    print(f"{args.heavy_jobs} heavy jobs from one user, then {args.light_users} light users, "
+          f"{args.workers} workers\n")
+    print(f"{'queue':<24} {'light avg wait':>15} {'light max wait':>15} {'heavy avg wait':>15}")
+    for label, jobs_queue in (("first come first served", FifoQueue()),
+                              ("fair (DRR)", FairQueue(10 ** 6, get_setting('JOB_QUANTUM_TOKENS')))):
+        waits = run(jobs_queue, args)
+        light, heavy = waits['light'], waits['heavy']
+        print(f"{label:<24} {sum(light) / len(light):>14.2f}s {max(light):>14.2f}s "
+              f"{sum(heavy) / len(heavy):>14.2f}s")
+
+
+if __name__ == '__main__':
+    main()
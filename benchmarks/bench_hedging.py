@@ -0,0 +1,78 @@
+"""
+Tail latency of LLM calls with and without hedging, against two local fake
+providers: a primary with a slow tail and a steady alternate.
+
+    python -m benchmarks.bench_hedging --calls 200 --slow-rate 0.03 --slow-latency 4
+"""
+import argparse
+import os
+import time
+from benchmarks.fake_deepseek import start_server
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run(label, calls, streamed):
+    from modules import llm_client
+
+    messages = [{"role": "user", "content": "Create study material. CONTENT: binary search trees"}]
+    samples = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        if streamed:
+            first = []
+            llm_client.stream_chat_completion(messages, "deepseek-chat", 0.4,
+                                              lambda text: first or first.append(time.perf_counter()),
+                                              response_format={"type": "json_object"})
+            samples.append(first[0] - start)
+        else:
+            llm_client.chat_completion(messages, model="deepseek-chat", temperature=0.4,
+                                       response_format={"type": "json_object"})
+            samples.append(time.perf_counter() - start)
+    print(f"{label:<28} p50 {percentile(samples, 50):6.2f}s  p95 {percentile(samples, 95):6.2f}s  "
+          f"p99 {percentile(samples, 99):6.2f}s  max {max(samples):6.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.3, help="normal seconds per completion")
+    parser.add_argument('--slow-rate', type=float, default=0.03,
+                        help="primary's share of stalled requests; keep it under 1 - LLM_HEDGE_PERCENTILE")
+    parser.add_argument('--slow-latency', type=float, default=4.0)
+    parser.add_argument('--stream', action='store_true', help="measure time to first token of streamed calls")
+    args = parser.parse_args()
+
+    _, primary = start_server(latency=args.latency, jitter=args.latency / 10, first_token=args.latency / 3,
+                              slow_rate=args.slow_rate, slow_latency=args.slow_latency)
+    _, alternate = start_server(latency=args.latency * 1.5, jitter=args.latency / 10,
+                                first_token=args.latency / 2)
+    # Providers are read from the environment when llm_client is imported
+    os.environ.update({
+        'DEEPSEEK_API_BASE': primary, 'DEEPSEEK_API_KEY': 'bench',
+        'LLM_FALLBACK_PROVIDERS': 'alternate', 'LLM_ALTERNATE_API_BASE': alternate,
+        'LLM_ALTERNATE_API_KEY': 'bench',
+    })
+    from modules import llm_client
+
+    mode = "time to first token" if args.stream else "time to full response"
+    print(f"{args.calls} calls each, {mode}; primary stalls {args.slow_rate:.0%} of requests "
+          f"for {args.slow_latency}s\n")
+    llm_client.LLM_HEDGE = False
+    run("primary only", args.calls, args.stream)
+    llm_client.LLM_HEDGE = True
+    run("hedged to the alternate", args.calls, args.stream)
+
+    stats = llm_client.client_stats()
+    print(f"\n{stats['hedged']} hedges sent, {stats['hedges_won']} won by the alternate, "
+          f"{stats['fallbacks']} fallbacks")
+    for name, provider in stats['providers'].items():
+        latency = provider['first_token_latency' if args.stream else 'latency']
+        print(f"  {name:<10} breaker {provider['breaker_state']:<9} average {latency or 0:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Output tokens and latency per study page, LLM-written HTML vs structured JSON.
+
+Calls the configured chat endpoint (DEEPSEEK_API_BASE / DEEPSEEK_API_KEY)
+with both prompts and reports the `usage` counts. Append each run to a
+JSONL file with --log to track the numbers over time.
+
+    python -m benchmarks.bench_output_tokens --runs 3 --pdf uploads/UIUX.pdf
+"""
+import argparse
+import json
+import time
+from datetime import datetime
+from modules.ai_utils import (
+    DEEPSEEK_MODEL, TEMPERATURE, MAX_INPUT_CHARS, PROMPT_VERSION,
+    build_html_prompt, build_json_prompt,
+)
+from modules.llm_client import chat_completion
+
+SAMPLE_TEXT = """
+A binary search tree (BST) is a binary tree in which every node's key is greater
+than all keys in its left subtree and smaller than all keys in its right subtree.
+Search, insertion and deletion take O(h) time, where h is the height of the tree.
+A balanced BST such as an AVL tree keeps h = O(log n) by rotating nodes after
+updates. An in-order traversal of a BST visits the keys in sorted order. Deleting
+a node with two children replaces it with its in-order successor.
+"""
+
+
+def measure(prompt, extra):
+    start = time.perf_counter()
+    data = chat_completion([{"role": "user", "content": prompt}],
+                           model=DEEPSEEK_MODEL, temperature=TEMPERATURE, **extra)
+    elapsed = time.perf_counter() - start
+    usage = data.get('usage') or {}
+    content = data.get('choices', [{}])[0].get('message', {}).get('content') or ''
+    return {
+        'seconds': elapsed,
+        'prompt_tokens': usage.get('prompt_tokens', 0),
+        'completion_tokens': usage.get('completion_tokens', 0),
+        'output_chars': len(content),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--pdf', help="use the text of this PDF instead of the built-in sample")
+    parser.add_argument('--log', help="append a JSON line with the averages to this file")
+    args = parser.parse_args()
+
+    text = SAMPLE_TEXT
+    if args.pdf:
+        from modules.pdf_utils import extract_text_from_pdf
+        text = extract_text_from_pdf(args.pdf, max_chars=MAX_INPUT_CHARS)
+    text = text[:MAX_INPUT_CHARS]
+
+    modes = {
+        'html': (build_html_prompt(text), {}),
+        'json': (build_json_prompt(text), {'response_format': {'type': 'json_object'}}),
+    }
+    results = {}
+    for mode, (prompt, extra) in modes.items():
+        samples = [measure(prompt, extra) for _ in range(args.runs)]
+        results[mode] = {key: sum(s[key] for s in samples) / len(samples) for key in samples[0]}
+
+    print(f"{'mode':<6} {'prompt tok':>11} {'output tok':>11} {'output chars':>13} {'seconds':>9}")
+    for mode, r in results.items():
+        print(f"{mode:<6} {r['prompt_tokens']:>11.0f} {r['completion_tokens']:>11.0f} "
+              f"{r['output_chars']:>13.0f} {r['seconds']:>9.2f}")
+    if results['html']['completion_tokens']:
+        ratio = results['json']['completion_tokens'] / results['html']['completion_tokens']
+        print(f"\nJSON mode uses {ratio:.0%} of the HTML mode's output tokens")
+
+    if args.log:
+        with open(args.log, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({
+                'at': datetime.now().isoformat(timespec='seconds'),
+                'model': DEEPSEEK_MODEL,
+                'prompt_version': PROMPT_VERSION,
+                'runs': args.runs,
+                'results': results,
+            }) + '\n')
+
+
+if __name__ == '__main__':
+    main()
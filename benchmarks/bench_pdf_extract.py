@@ -0,0 +1,57 @@
+"""
+Compare PDF text extraction strategies on a large generated deck.
+
+    python -m benchmarks.bench_pdf_extract --pages 240 --workers 4
+"""
+import argparse
+import os
+import tempfile
+import time
+import fitz  # PyMuPDF
+from modules.pdf_utils import extract_text_from_pdf
+from modules.ai_utils import MAX_INPUT_CHARS
+from benchmarks.sample_pdfs import make_pdf
+
+
+def legacy_extract(path):
+    # The original implementation, kept for comparison
+    text = ""
+    with fitz.open(path) as doc:
+        for page in doc:
+            text += page.get_text()
+    return text
+
+
+def timed(label, func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{label:<32} {best * 1000:9.1f} ms  {len(result):>10,} chars")
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--pages', type=int, default=240)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'deck.pdf')
+        make_pdf(path, args.pages)
+        print(f"{args.pages} pages, {os.path.getsize(path):,} bytes, best of {args.repeat}\n")
+
+        timed("legacy (str +=)", lambda: legacy_extract(path), args.repeat)
+        timed("serial (join)", lambda: extract_text_from_pdf(path, workers=0), args.repeat)
+        timed(f"parallel ({args.workers} processes)",
+              lambda: extract_text_from_pdf(path, workers=args.workers), args.repeat)
+        timed(f"serial, {MAX_INPUT_CHARS} char budget",
+              lambda: extract_text_from_pdf(path, max_chars=MAX_INPUT_CHARS, workers=0), args.repeat)
+
+
+if __name__ == '__main__':
+    main()
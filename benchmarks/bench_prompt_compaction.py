@@ -0,0 +1,74 @@
+"""
+Prompt size before and after compaction (boilerplate removal + salient
+sentence selection), on a generated slide deck or a real PDF.
+
+Token counts are estimated from the character count; with --live the
+study-page prompt is also sent to the configured chat endpoint
+(DEEPSEEK_API_BASE / DEEPSEEK_API_KEY) and the reported `usage` and
+latency are printed.
+
+    python -m benchmarks.bench_prompt_compaction --pages 30
+    python -m benchmarks.bench_prompt_compaction --pdf uploads/UIUX.pdf --live
+"""
+import argparse
+import os
+import tempfile
+import time
+from modules.ai_utils import DEEPSEEK_MODEL, TEMPERATURE, MAX_INPUT_CHARS, build_json_prompt
+from modules.llm_client import chat_completion
+from modules.pdf_utils import CHARS_PER_TOKEN, extract_text_from_pdf
+from modules.prompt_compaction import clean_text, compact_text
+from benchmarks.sample_pdfs import make_pdf
+
+
+def tokens(text):
+    return len(text) // CHARS_PER_TOKEN
+
+
+def measure(prompt):
+    start = time.perf_counter()
+    data = chat_completion([{"role": "user", "content": prompt}], model=DEEPSEEK_MODEL,
+                           temperature=TEMPERATURE, response_format={"type": "json_object"})
+    usage = data.get('usage') or {}
+    return usage.get('prompt_tokens', 0), usage.get('completion_tokens', 0), time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--pages', type=int, default=30)
+    parser.add_argument('--pdf', help="use this PDF instead of a generated deck")
+    parser.add_argument('--live', action='store_true', help="also send both prompts to the chat endpoint")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.pdf or make_pdf(os.path.join(tmp, 'deck.pdf'), args.pages, boilerplate=True)
+        text = extract_text_from_pdf(path)
+
+    start = time.perf_counter()
+    cleaned = clean_text(text)
+    clean_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    compacted = compact_text(text, MAX_INPUT_CHARS)
+    compact_seconds = time.perf_counter() - start
+    truncated = text[:MAX_INPUT_CHARS]
+
+    print(f"{'input':<34} {'chars':>9} {'~tokens':>8}")
+    print(f"{'extracted text':<34} {len(text):>9,} {tokens(text):>8,}")
+    print(f"{'cleaned (boilerplate dropped)':<34} {len(cleaned):>9,} {tokens(cleaned):>8,}"
+          f"   {clean_seconds * 1000:.1f} ms")
+    print(f"{'before: first chars':<34} {len(truncated):>9,} {tokens(truncated):>8,}")
+    print(f"{'after: salient sentences':<34} {len(compacted):>9,} {tokens(compacted):>8,}"
+          f"   {compact_seconds * 1000:.1f} ms")
+    distinct_before = len(set(clean_text(truncated).split('\n')))
+    distinct_after = len(set(compacted.split('\n')))
+    print(f"\ndistinct lines in the prompt: {distinct_before} before, {distinct_after} after")
+
+    if args.live:
+        print(f"\n{'prompt':<8} {'prompt tok':>11} {'output tok':>11} {'seconds':>9}")
+        for label, body in (('before', truncated), ('after', compacted)):
+            prompt_tokens, completion_tokens, seconds = measure(build_json_prompt(body))
+            print(f"{label:<8} {prompt_tokens:>11} {completion_tokens:>11} {seconds:>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""
+Peak server RSS while receiving concurrent large PDF uploads on /process.
+
+Starts the app in a child process (threaded Werkzeug server, job workers
+disabled so only the upload path is measured), streams multipart bodies
+from a generator so the client never holds a whole file, and reports the
+server's peak RSS for each upload size.
+
+    python -m benchmarks.bench_upload_memory --sizes 1 20 80 --concurrency 8
+"""
+import argparse
+import http.client
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import uuid
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVER = """
+from werkzeug.serving import make_server
+from app import create_app
+server = make_server('127.0.0.1', 0, create_app(), threaded=True)
+print('PORT', server.server_port, flush=True)
+server.serve_forever()
+"""
+
+
+def read_status(pid, field):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def reset_peak(pid):
+    # Linux >= 4.0: writing 5 to clear_refs resets VmHWM
+    try:
+        with open(f"/proc/{pid}/clear_refs", 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def login(port):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    user = f"bench_{uuid.uuid4().hex[:8]}"
+    form = urllib.parse.urlencode({'username': user, 'email': f"{user}@example.com", 'password': 'pw'})
+    headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+    conn.request('POST', '/register', form, headers)
+    conn.getresponse().read()
+    conn.request('POST', '/login', urllib.parse.urlencode({'username': user, 'password': 'pw'}), headers)
+    response = conn.getresponse()
+    response.read()
+    return response.getheader('Set-Cookie').split(';')[0]
+
+
+def upload(port, cookie, size):
+    boundary = uuid.uuid4().hex
+    head = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"pdf_file\"; "
+            f"filename=\"big.pdf\"\r\nContent-Type: application/pdf\r\n\r\n").encode()
+    tail = f"\r\n--{boundary}--\r\n".encode()
+    block = os.urandom(64 * 1024)
+
+    def body():
+        yield head
+        yield b'%PDF-1.7\n'
+        remaining = size - 9
+        while remaining > 0:
+            yield block[:min(len(block), remaining)]
+            remaining -= len(block)
+        yield tail
+
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=300)
+    conn.putrequest('POST', '/process')
+    conn.putheader('Cookie', cookie)
+    conn.putheader('Content-Type', f"multipart/form-data; boundary={boundary}")
+    conn.putheader('Content-Length', str(len(head) + size + len(tail)))
+    conn.endheaders()
+    for piece in body():
+        conn.send(piece)
+    response = conn.getresponse()
+    response.read()
+    return response.status
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 20, 80], help="upload sizes in MB")
+    parser.add_argument('--concurrency', type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ,
+                   PYTHONPATH=REPO_ROOT,
+                   JOB_WORKERS='0',
+                   MAX_UPLOAD_MB=str(max(args.sizes) + 1),
+                   DATABASE_PATH=os.path.join(tmp, 'bench.sqlite'))
+        server = subprocess.Popen([sys.executable, '-c', SERVER], cwd=tmp, env=env,
+                                  stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        try:
+            line = server.stdout.readline()
+            while not line.startswith('PORT'):
+                line = server.stdout.readline()
+            port = int(line.split()[1])
+            cookie = login(port)
+            upload(port, cookie, 1024 * 1024)  # warm up imports and code paths
+            baseline = read_status(server.pid, 'VmRSS')
+            print(f"server baseline RSS {baseline / 2**20:.1f} MB, {args.concurrency} concurrent uploads\n")
+
+            for size_mb in args.sizes:
+                peak_resettable = reset_peak(server.pid)
+                peak = 0
+                done = threading.Event()
+
+                def sample():
+                    nonlocal peak
+                    while not done.is_set():
+                        peak = max(peak, read_status(server.pid, 'VmRSS'))
+                        time.sleep(0.01)
+
+                sampler = threading.Thread(target=sample)
+                sampler.start()
+                start = time.perf_counter()
+                threads = [threading.Thread(target=upload, args=(port, cookie, size_mb * 1024 * 1024))
+                           for _ in range(args.concurrency)]
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+                elapsed = time.perf_counter() - start
+                done.set()
+                sampler.join()
+                if peak_resettable:
+                    peak = max(peak, read_status(server.pid, 'VmHWM'))
+
+                print(f"{size_mb:>5} MB x {args.concurrency}: peak RSS {peak / 2**20:7.1f} MB "
+                      f"(+{(peak - baseline) / 2**20:5.1f} MB over baseline) in {elapsed:.1f}s")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
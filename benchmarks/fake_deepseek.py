@@ -0,0 +1,189 @@
+"""
+Local stand-in for the DeepSeek /chat/completions endpoint.
+
+Point the app at it with DEEPSEEK_API_BASE=http://127.0.0.1:<port>.
+Latency, failures, 429s and a slow tail are configurable so the app's
+retry, breaker, hedging and queueing behaviour can be exercised without
+spending tokens. Any OpenAI-compatible provider can be stood in for the
+same way (LLM_<NAME>_API_BASE).
+
+    python -m benchmarks.fake_deepseek --port 8765 --latency 2 --jitter 0.5 --error-rate 0.02
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+STUDY_DATA = {
+    "title": "Binary Search Trees",
+    "summary": ("A binary search tree keeps keys ordered so that search, insertion and deletion "
+                "take time proportional to its height. Balanced variants such as AVL trees keep "
+                "the height logarithmic. An in-order traversal visits keys in sorted order."),
+    "mcq": [
+        {"question": "What is the search cost in a BST of height h?",
+         "options": ["O(1)", "O(h)", "O(n log n)", "O(n^2)"], "answer": 1},
+        {"question": "Which traversal visits BST keys in sorted order?",
+         "options": ["Pre-order", "Post-order", "In-order", "Level-order"], "answer": 2},
+        {"question": "What do AVL trees use to stay balanced?",
+         "options": ["Hashing", "Rotations", "Recursion limits", "Sorting"], "answer": 1},
+    ],
+    "true_false": [
+        {"statement": "Every BST is balanced.", "answer": False},
+        {"statement": "A node's left subtree holds smaller keys.", "answer": True},
+    ],
+    "fill_in": [{"prompt": "Deleting a node with two children uses its in-order ___.", "answer": "successor"}],
+}
+
+
+def _html_page():
+    questions = "".join(
+        f'<div class="question"><p><strong>{i + 1}. {q["question"]}</strong></p>'
+        + "".join(f'<div class="option"><input type="radio" name="q{i + 1}" value="{j}"> {o}</div>'
+                  for j, o in enumerate(q["options"]))
+        + "</div>\n"
+        for i, q in enumerate(STUDY_DATA["mcq"])
+    )
+    # Padding stands in for the inline CSS/JS a real model writes
+    style = "\n".join(f".rule-{i} {{ margin: {i}px; padding: {i}px; color: #333; }}" for i in range(120))
+    return (f"<!DOCTYPE html><html><head><title>{STUDY_DATA['title']}</title><style>{style}</style></head>"
+            f"<body><h1>{STUDY_DATA['title']}</h1><p>{STUDY_DATA['summary']}</p>{questions}</body></html>")
+
+
+class FakeDeepSeekHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    options = {}
+    stats = {'requests': 0, 'errors': 0, 'rate_limited': 0}
+    stats_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle(self):
+        try:
+            super().handle()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client hung up, e.g. a hedged request that lost
+
+    def _count(self, name):
+        with self.stats_lock:
+            self.stats[name] += 1
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        request = json.loads(self.rfile.read(length) or b'{}')
+        self._count('requests')
+        opts = self.options
+
+        roll = random.random()
+        if roll < opts['rate_limit_rate']:
+            self._count('rate_limited')
+            return self._send_json(429, {"error": {"message": "Rate limit reached"}},
+                                   {'Retry-After': str(opts['retry_after'])})
+        if roll < opts['rate_limit_rate'] + opts['error_rate']:
+            self._count('errors')
+            time.sleep(opts['latency'] / 2)
+            return self._send_json(500, {"error": {"message": "Internal error"}})
+
+        prompt = " ".join(m.get('content', '') for m in request.get('messages', []))
+        if request.get('response_format'):
+            content = json.dumps(STUDY_DATA)
+        elif 'study notes from part' in prompt:
+            content = STUDY_DATA['summary']
+        else:
+            content = _html_page()
+        usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        # A slow request stands in for the provider's worst minute
+        slow = opts['slow_latency'] if random.random() < opts['slow_rate'] else 0.0
+        if request.get('stream'):
+            return self._stream(content, usage, slow)
+
+        time.sleep(slow or max(0.0, random.gauss(opts['latency'], opts['jitter'])))
+        self._send_json(200, {
+            "id": "fake", "object": "chat.completion", "model": request.get('model'),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                         "finish_reason": "stop"}],
+            "usage": usage,
+        })
+
+    def _stream(self, content, usage, slow=0.0):
+        opts = self.options
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        def send(event):
+            data = f"data: {event}\n\n".encode()
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+
+        time.sleep(slow or opts['first_token'])
+        piece = 16  # roughly four tokens per event
+        per_event = max(0.0, opts['latency'] - opts['first_token']) / max(1, len(content) // piece)
+        for i in range(0, len(content), piece):
+            send(json.dumps({"choices": [{"index": 0, "delta": {"content": content[i:i + piece]}}]}))
+            time.sleep(per_event)
+        send(json.dumps({"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "usage": usage}))
+        send("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def start_server(host='127.0.0.1', port=0, latency=1.0, jitter=0.2, error_rate=0.0,
+                 rate_limit_rate=0.0, retry_after=1, first_token=0.3, slow_rate=0.0, slow_latency=10.0):
+    """Run the fake API on a background thread. Returns (server, base_url)."""
+    handler = type('Handler', (FakeDeepSeekHandler,), {
+        'options': {
+            'latency': latency, 'jitter': jitter, 'error_rate': error_rate,
+            'rate_limit_rate': rate_limit_rate, 'retry_after': retry_after,
+            'first_token': first_token, 'slow_rate': slow_rate, 'slow_latency': slow_latency,
+        },
+        'stats': {'requests': 0, 'errors': 0, 'rate_limited': 0},
+        'stats_lock': threading.Lock(),
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=1.0, help="mean seconds per completion")
+    parser.add_argument('--jitter', type=float, default=0.2, help="std-dev of the latency")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction answered with HTTP 500")
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="fraction answered with HTTP 429")
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--first-token', type=float, default=0.3, help="seconds before the first streamed token")
+    parser.add_argument('--slow-rate', type=float, default=0.0, help="fraction of requests that stall")
+    parser.add_argument('--slow-latency', type=float, default=10.0, help="seconds a stalled request takes")
+    args = parser.parse_args()
+
+    server, base = start_server(args.host, args.port, args.latency, args.jitter, args.error_rate,
+                                args.rate_limit_rate, args.retry_after, args.first_token,
+                                args.slow_rate, args.slow_latency)
+    print(f"Fake DeepSeek API on {base} (DEEPSEEK_API_BASE={base})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+"""
+Concurrent load test of the main user flow against a local DeepSeek stand-in.
+
+By default starts the fake API (benchmarks.fake_deepseek) in-process and the
+app in a child process pointed at it, then runs --users virtual users for
+--duration seconds. Each user logs in and loops over /dashboard, /process
+(with a sample PDF), the job status poll, /generated/<filename> and
+/submit_quiz. Reports p50/p95/p99 latency per endpoint, throughput and the
+server's RSS. The local app runs without the per-user request and token
+limits unless --user-limits is given; /process calls bounced by them are
+reported as their own row.
+
+    python -m benchmarks.load_test --users 8 --duration 60 --llm-latency 2 --error-rate 0.02
+
+Use --target to drive an already running deployment instead (its DeepSeek
+base URL must then be set by hand; pass --pid to also sample its RSS).
+"""
+import argparse
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+import requests
+from benchmarks.bench_upload_memory import REPO_ROOT, SERVER, read_status
+from benchmarks.fake_deepseek import start_server
+from benchmarks.sample_pdfs import make_sample_set
+
+JOB_TIMEOUT = 300
+# Seconds a virtual user backs off after being told it is over its quota
+RATE_LIMITED_PAUSE = 1.0
+
+_samples = defaultdict(list)
+_errors = defaultdict(int)
+_lock = threading.Lock()
+
+
+def record(name, seconds, ok=True):
+    with _lock:
+        _samples[name].append(seconds)
+        if not ok:
+            _errors[name] += 1
+
+
+def timed(name, session, method, url, ok_statuses=(200, 302, 304), **kwargs):
+    start = time.perf_counter()
+    try:
+        response = session.request(method, url, allow_redirects=False, timeout=60, **kwargs)
+    except requests.RequestException:
+        record(name, time.perf_counter() - start, ok=False)
+        return None
+    record(name, time.perf_counter() - start, ok=response.status_code in ok_statuses)
+    return response
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def login(base):
+    session = requests.Session()
+    user = f"load_{uuid.uuid4().hex[:10]}"
+    session.post(f"{base}/register", allow_redirects=False, timeout=60,
+                 data={'username': user, 'email': f"{user}@example.com", 'password': 'pw'})
+    response = timed('POST /login', session, 'POST', f"{base}/login",
+                     data={'username': user, 'password': 'pw'})
+    if response is None or response.status_code != 302:
+        return None
+    return session
+
+
+def wait_for_job(base, session, job_path):
+    deadline = time.monotonic() + JOB_TIMEOUT
+    while time.monotonic() < deadline:
+        response = timed('GET /jobs/<id>/status', session, 'GET', f"{base}{job_path}/status")
+        if response is not None and response.status_code == 200:
+            job = response.json()
+            if job['status'] == 'done':
+                return job['url']
+            if job['status'] == 'failed':
+                return None
+        time.sleep(0.25)
+    return None
+
+
+def rate_limited(base, session, location):
+    """Whether a /process bounce was the per-user quota (its flash message says so)."""
+    if not location:
+        return False
+    try:
+        page = session.get(location if location.startswith('http') else f"{base}{location}", timeout=60)
+    except requests.RequestException:
+        return False
+    return 'faster than your quota allows' in page.text
+
+
+def quiz_answers(html):
+    """Pick an answer for every q<n> field on a generated page."""
+    answers = {}
+    for match in re.finditer(r'name="(q\d+)"(?: value="([^"]*)")?', html):
+        name, value = match.groups()
+        answers.setdefault(name, value if value is not None else "answer")
+    page_id = re.search(r'name="page_id" value="([^"]*)"', html)
+    answers['page_id'] = page_id.group(1) if page_id else ''
+    answers['subject'] = 'load_test'
+    return answers
+
+
+def virtual_user(base, pdfs, deadline, think, completed):
+    session = login(base)
+    if session is None:
+        return
+    while time.monotonic() < deadline:
+        timed('GET /dashboard', session, 'GET', f"{base}/dashboard")
+
+        path = random.choice(pdfs)
+        with open(path, 'rb') as f:
+            start = time.perf_counter()
+            response = timed('POST /process', session, 'POST', f"{base}/process",
+                             files={'pdf_file': (os.path.basename(path), f, 'application/pdf')})
+        location = response.headers.get('Location', '') if response is not None else ''
+        if '/jobs/' not in location:
+            if rate_limited(base, session, location):
+                record('POST /process rate limited', time.perf_counter() - start)
+                time.sleep(RATE_LIMITED_PAUSE)
+            else:
+                record('job end-to-end', time.perf_counter() - start, ok=False)
+            continue
+        url = wait_for_job(base, session, location[location.index('/jobs/'):])
+        record('job end-to-end', time.perf_counter() - start, ok=url is not None)
+        if url is None:
+            continue
+        completed.append(1)
+
+        page = timed('GET /generated/<f>', session, 'GET', f"{base}{url}",
+                     headers={'Accept-Encoding': 'gzip, br'})
+        if page is not None and page.status_code == 200:
+            etag = page.headers.get('ETag')
+            if etag:
+                timed('GET /generated/<f> (304)', session, 'GET', f"{base}{url}",
+                      headers={'If-None-Match': etag}, ok_statuses=(304,))
+            timed('POST /submit_quiz', session, 'POST', f"{base}/submit_quiz",
+                  data=quiz_answers(page.text))
+        if think:
+            time.sleep(random.uniform(0, 2 * think))
+
+
+def start_app(workdir, api_base, job_workers, user_limits=False):
+    env = dict(os.environ,
+               PYTHONPATH=REPO_ROOT,
+               DEEPSEEK_API_BASE=api_base,
+               DEEPSEEK_API_KEY='bench',
+               DATABASE_PATH=os.path.join(workdir, 'bench.sqlite'))
+    if job_workers is not None:
+        env['JOB_WORKERS'] = str(job_workers)
+    if not user_limits:
+        # A virtual user submits far faster than a student; measure the server, not the quota
+        env.update(USER_REQUESTS_PER_MINUTE='0', USER_TOKENS_PER_MINUTE='0')
+    server = subprocess.Popen([sys.executable, '-c', SERVER], cwd=workdir, env=env,
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    line = server.stdout.readline()
+    while line and not line.startswith('PORT'):
+        line = server.stdout.readline()
+    if not line:
+        raise RuntimeError("app server exited before listening")
+    return server, f"http://127.0.0.1:{int(line.split()[1])}"
+
+
+def report(elapsed, completed, rss):
+    total = sum(len(s) for s in _samples.values())
+    print(f"{'endpoint':<28} {'count':>7} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    results = {}
+    for name in sorted(_samples):
+        ordered = sorted(_samples[name])
+        row = {
+            'count': len(ordered), 'errors': _errors[name],
+            'p50': percentile(ordered, 0.50), 'p95': percentile(ordered, 0.95),
+            'p99': percentile(ordered, 0.99), 'max': ordered[-1],
+        }
+        results[name] = row
+        print(f"{name:<28} {row['count']:>7} {row['errors']:>7} {row['p50'] * 1000:>9.1f} "
+              f"{row['p95'] * 1000:>9.1f} {row['p99'] * 1000:>9.1f} {row['max'] * 1000:>9.1f}")
+    print(f"\n{total / elapsed:.1f} requests/s, {completed / elapsed * 60:.1f} study pages/min "
+          f"over {elapsed:.0f}s")
+    if rss:
+        print(f"server RSS: start {rss['start'] / 2**20:.1f} MB, peak {rss['peak'] / 2**20:.1f} MB, "
+              f"end {rss['end'] / 2**20:.1f} MB")
+    return {'seconds': elapsed, 'requests_per_second': total / elapsed,
+            'pages_per_minute': completed / elapsed * 60, 'endpoints': results, 'rss': rss}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30, help="seconds")
+    parser.add_argument('--think', type=float, default=0.0, help="mean pause between iterations")
+    parser.add_argument('--variants', type=int, default=4,
+                        help="distinct PDFs per size; fewer means more generation cache hits")
+    parser.add_argument('--llm-latency', type=float, default=1.0)
+    parser.add_argument('--llm-jitter', type=float, default=0.2)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0)
+    parser.add_argument('--job-workers', type=int, help="JOB_WORKERS for the local app")
+    parser.add_argument('--user-limits', action='store_true',
+                        help="keep the local app's per-user request and token limits")
+    parser.add_argument('--target', help="base URL of a running app instead of starting one")
+    parser.add_argument('--pid', type=int, help="with --target: server pid to sample RSS from")
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        samples = make_sample_set(os.path.join(tmp, 'pdfs'), variants=args.variants)
+        pdfs = [path for paths in samples.values() for path in paths]
+
+        server = fake = None
+        base, pid = args.target, args.pid
+        if base is None:
+            fake, api_base = start_server(latency=args.llm_latency, jitter=args.llm_jitter,
+                                          error_rate=args.error_rate,
+                                          rate_limit_rate=args.rate_limit_rate)
+            server, base = start_app(tmp, api_base, args.job_workers, args.user_limits)
+            pid = server.pid
+
+        rss = None
+        done = threading.Event()
+        if pid:
+            rss = {'start': read_status(pid, 'VmRSS'), 'peak': 0, 'end': 0}
+
+            def sample():
+                while not done.is_set():
+                    rss['peak'] = max(rss['peak'], read_status(pid, 'VmRSS'))
+                    time.sleep(0.1)
+
+            threading.Thread(target=sample, daemon=True).start()
+
+        try:
+            print(f"{args.users} users for {args.duration:.0f}s against {base}\n")
+            completed = []
+            start = time.monotonic()
+            deadline = start + args.duration
+            users = [threading.Thread(target=virtual_user,
+                                      args=(base, pdfs, deadline, args.think, completed))
+                     for _ in range(args.users)]
+            for t in users:
+                t.start()
+            for t in users:
+                t.join()
+            elapsed = time.monotonic() - start
+            done.set()
+            if rss:
+                rss['end'] = read_status(pid, 'VmRSS')
+            results = report(elapsed, len(completed), rss)
+            if fake is not None:
+                print(f"fake API: {dict(fake.RequestHandlerClass.stats)}")
+                fake.shutdown()
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
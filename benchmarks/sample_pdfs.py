@@ -0,0 +1,71 @@
+"""
+Generated lecture-style PDFs of varying size for the benchmarks.
+
+    python -m benchmarks.sample_pdfs --out bench_pdfs --pages 2 20 120 --variants 3
+"""
+import argparse
+import os
+import fitz  # PyMuPDF
+
+SIZES = {'small': 2, 'medium': 20, 'large': 120}
+
+TOPICS = [
+    "binary search trees keep keys ordered",
+    "hash tables trade memory for constant-time lookups",
+    "heaps give O(log n) insertion into a priority queue",
+    "graph traversals visit every reachable vertex once",
+    "dynamic programming reuses answers to overlapping subproblems",
+]
+
+
+def make_pdf(path, pages, seed=0, boilerplate=False):
+    """
+    Write a `pages`-page PDF; different seeds give different text (and cache
+    keys). With `boilerplate`, every page also gets a course header and a
+    "Page n of N" footer, like real slide decks.
+    """
+    doc = fitz.open()
+    for number in range(pages):
+        page = doc.new_page()
+        topic = TOPICS[(number + seed) % len(TOPICS)]
+        body = "\n".join(
+            f"Slide {number + 1}, line {line} (deck {seed}): {topic}."
+            for line in range(45)
+        )
+        if boilerplate:
+            body = (f"CS 201 Data Structures - Lecture {seed + 1}\nDepartment of Computer Science\n"
+                    f"{body}\n\n{number + 1}\nPage {number + 1} of {pages}")
+        page.insert_text((40, 40), body, fontsize=8)
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def make_sample_set(folder, sizes=None, variants=1):
+    """Write `variants` distinct PDFs per size. Returns {size name: [paths]}."""
+    os.makedirs(folder, exist_ok=True)
+    samples = {}
+    for name, pages in (sizes or SIZES).items():
+        samples[name] = [
+            make_pdf(os.path.join(folder, f"{name}_{seed}.pdf"), pages, seed)
+            for seed in range(variants)
+        ]
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--out', default='bench_pdfs')
+    parser.add_argument('--pages', type=int, nargs=3, metavar=('SMALL', 'MEDIUM', 'LARGE'),
+                        default=list(SIZES.values()))
+    parser.add_argument('--variants', type=int, default=1, help="distinct decks per size")
+    args = parser.parse_args()
+
+    samples = make_sample_set(args.out, dict(zip(SIZES, args.pages)), args.variants)
+    for name, paths in samples.items():
+        for path in paths:
+            print(f"{name:<7} {os.path.getsize(path):>10,} bytes  {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -7,14 +7,54 @@ class Config:
     SECRET_KEY = os.getenv("SECRET_KEY", "default_secret_key")
     UPLOAD_FOLDER = os.path.join(os.getcwd(), "uploads")
     OUTPUT_FOLDER = os.path.join(os.getcwd(), "outputs")
+    GENERATED_FOLDER = os.path.join(os.getcwd(), "generated")
+    # Course material: data/<subject>/{lectures,labs,summaries}
+    DATA_FOLDER = os.path.join(os.getcwd(), "data")
     SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL", "sqlite:///instance/database.sqlite")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
     DEEPSEEK_API_BASE = os.getenv("DEEPSEEK_API_BASE", "https://api.deepseek.com")
-    MAX_CONTENT_LENGTH = 10 * 1024 * 1024
+    MAX_CONTENT_LENGTH = int(os.getenv("MAX_UPLOAD_MB", 10)) * 1024 * 1024
+    # Non-file form fields (the pasted text) are held in memory, so cap them separately
+    MAX_FORM_MEMORY_SIZE = 2 * 1024 * 1024
+    # /metrics requires "Authorization: Bearer <token>"; without a token it is only served in debug mode
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+    DATABASE_PATH = os.getenv("DATABASE_PATH", os.path.join('instance', 'database.sqlite'))
+    # Generation job workers per process and the pending jobs they may fall behind by
+    JOB_WORKERS = int(os.getenv("JOB_WORKERS", 4))
+    JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", 64))
+    # Estimated prompt tokens each user with queued jobs may start per round of the
+    # fair scheduler; a job bigger than this waits a few rounds for its turn
+    JOB_QUANTUM_TOKENS = int(os.getenv("JOB_QUANTUM_TOKENS", 1000))
+    # Per-user budgets for /process: a sustained rate per minute and the burst allowed
+    # on top (0 leaves that dimension unlimited)
+    USER_REQUESTS_PER_MINUTE = float(os.getenv("USER_REQUESTS_PER_MINUTE", 4))
+    USER_REQUEST_BURST = float(os.getenv("USER_REQUEST_BURST", 8))
+    USER_TOKENS_PER_MINUTE = float(os.getenv("USER_TOKENS_PER_MINUTE", 20000))
+    USER_TOKEN_BURST = float(os.getenv("USER_TOKEN_BURST", 80000))
+    # Budget shared by every LLM call of every process; set it to the provider
+    # account's limits (0 leaves that dimension unlimited)
+    LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", 0))
+    LLM_TOKENS_PER_MINUTE = float(os.getenv("LLM_TOKENS_PER_MINUTE", 0))
 
 class DevelopmentConfig(Config):
     DEBUG = True
 
 class ProductionConfig(Config):
-    DEBUG = False
\ No newline at end of file
+    DEBUG = False
+_active = None
+
+def use_config(config):
+    """Make `config` (an app.config) the one get_setting reads; create_app calls this."""
+    global _active
+    _active = config
+
+def get_setting(name):
+    """
+    A setting of the app this process serves (see create_app), or of
+    Config when no app was created (scripts, benchmarks). Read it at use,
+    not at import, so the app's config takes effect.
+    """
+    if _active is not None and name in _active:
+        return _active[name]
+    return getattr(Config, name)
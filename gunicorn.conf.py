@@ -0,0 +1,20 @@
+import os
+
+# gunicorn -c gunicorn.conf.py
+wsgi_app = "app:create_app()"
+
+# Build the app once in the master; workers fork from it already warm
+preload_app = True
+workers = int(os.getenv("WEB_CONCURRENCY", 2))
+# Threads, so slow uploads and status polls do not hold up other requests
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", 8))
+bind = os.getenv("BIND", "127.0.0.1:8000")
+timeout = 120
+
+
+def on_starting(server):
+    # The app imports these lazily; loading them before the fork lets every
+    # worker share the pages instead of importing them on its first request
+    import fitz  # noqa: F401
+    import requests  # noqa: F401
@@ -1 +1,3 @@
-# Modules package initialization
\ No newline at end of file
+# Modules package initialization.
+# Loads .env before any module reads its settings, whatever is imported first
+import config  # noqa: F401
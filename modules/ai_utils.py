@@ -1,12 +1,38 @@
 import os
-import requests
 import json
-from dotenv import load_dotenv
+from config import get_setting
+from modules.llm_client import (
+    chat_completion, stream_chat_completion,
+    LLMError, LLMTimeoutError, LLMConnectionError, CircuitOpenError,
+)
+from modules.quiz_utils import render_study_page
+from modules.prompt_compaction import compact_text
 
-load_dotenv()
+DEEPSEEK_MODEL = os.getenv("DEEPSEEK_MODEL", "deepseek-chat")
+TEMPERATURE = 0.4
+# Only this much of the input is sent to the model (the most salient part, see compact_text)
+MAX_INPUT_CHARS = 3000
+# "json": the model returns compact quiz data rendered by templates/ai_tool/study_page.html
+# "html": the model writes the whole page, inline CSS/JS included
+STUDY_PAGE_FORMAT = os.getenv("STUDY_PAGE_FORMAT", "json")
+# Use `stream: true` whenever a caller wants the output as it is generated
+LLM_STREAM = os.getenv("LLM_STREAM", "1") == "1"
+
+# Bump whenever the prompts below change so cached pages are not reused
+PROMPT_VERSION = "4"
+
+
+class AIServiceError(Exception):
+    """
+    Raised when DeepSeek does not produce a clean study page.
+    `page` holds the HTML to show the user instead (an error page, or the
+    raw output wrapped in a recovery shell).
+    """
+
+    def __init__(self, message, page=None):
+        super().__init__(message)
+        self.page = page or _generate_error_html(message)
 
-DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
-DEEPSEEK_API_BASE = os.getenv("DEEPSEEK_API_BASE", "https://api.deepseek.com")
 
 def generate_ai_output(text):
     """
@@ -14,13 +40,33 @@ def generate_ai_output(text):
     extract the HTML block if present, or wrap the text in a safe HTML shell.
     Returns a string containing a complete HTML document.
     """
-    if not DEEPSEEK_API_KEY:
-        return _generate_error_html("DeepSeek API key is not configured. Please set DEEPSEEK_API_KEY in your .env file.")
+    try:
+        return generate_study_html(text)
+    except AIServiceError as e:
+        return e.page
+
+
+def generate_study_html(text, max_chars=MAX_INPUT_CHARS, on_delta=None):
+    """
+    Same as generate_ai_output, but raises AIServiceError instead of
+    returning an error or recovery page, so callers can tell a clean
+    result (safe to cache) from a degraded one.
+    """
+    if STUDY_PAGE_FORMAT == "json":
+        return render_study_page(generate_study_data(text, max_chars, on_delta))
+    return _generate_llm_html(text, max_chars, on_delta)
 
-    # Keep input small to reduce drift
-    truncated_text = (text or "")[:3000]
 
-    prompt = f"""
+def _complete(prompt, on_delta=None, **extra):
+    """One chat completion; streamed into on_delta(text) when one is given."""
+    messages = [{"role": "user", "content": prompt}]
+    if on_delta is not None and LLM_STREAM:
+        return stream_chat_completion(messages, DEEPSEEK_MODEL, TEMPERATURE, on_delta, **extra)
+    return chat_completion(messages, model=DEEPSEEK_MODEL, temperature=TEMPERATURE, **extra)
+
+
+def build_html_prompt(text):
+    return f"""
 YOU MUST RETURN VALID HTML ONLY.
 
 ABSOLUTE RULES (if you break them the output is INVALID):
@@ -41,35 +87,154 @@ Include:
 3) JS to check answers and show score
 
 CONTENT TO ANALYZE:
-{truncated_text}
+{text}
 
 REMINDER: RETURN ONLY RAW HTML CODE FROM <!DOCTYPE html> TO </html>
 """
 
+
+def build_json_prompt(text):
+    return f"""
+Create study material for the content below. Reply with one JSON object only,
+no markdown, using exactly this shape:
+{{"title": str,
+ "summary": str (3-5 sentences),
+ "mcq": [{{"question": str, "options": [4 str], "answer": index of the correct option (0-3)}}] (3 items),
+ "true_false": [{{"statement": str, "answer": true|false}}] (2 items),
+ "fill_in": [{{"prompt": str containing ___ for the blank, "answer": str (1-3 words)}}] (1 item)}}
+
+CONTENT:
+{text}
+"""
+
+
+def generate_study_data(text, max_chars=MAX_INPUT_CHARS, on_delta=None):
+    """
+    Ask DeepSeek for the study page as compact JSON (see build_json_prompt)
+    and return it validated by validate_study_data. Raises AIServiceError.
+    With `on_delta`, the JSON is also passed to it as it streams in, minus
+    the answers: the stream goes to the student about to take the quiz.
+    """
+    if not get_setting('DEEPSEEK_API_KEY'):
+        raise AIServiceError("DeepSeek API key is not configured. Please set DEEPSEEK_API_KEY in your .env file.")
+
+    if on_delta is not None:
+        on_delta = _AnswerFilter(on_delta)
     try:
-        url = f"{DEEPSEEK_API_BASE}/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        payload = {
-            "model": "deepseek-chat",
-            "messages": [{"role": "user", "content": prompt}],
-            "temperature": 0.4
-        }
-        r = requests.post(url, headers=headers, json=payload, timeout=60)
-
-        if r.status_code == 401:
-            return _generate_error_html("Invalid DeepSeek API key.")
-        if r.status_code == 402:
-            return _generate_error_html("Payment required on DeepSeek API. Add credits or use another model/provider.")
-        if r.status_code == 429:
-            return _generate_error_html("Rate limit exceeded. Please try again later.")
-        if r.status_code >= 500:
-            return _generate_error_html("DeepSeek API server error. Please try again later.")
-
-        r.raise_for_status()
-        data = r.json()
+        data = _complete(build_json_prompt(compact_text(text, max_chars)), on_delta,
+                         response_format={"type": "json_object"})
+        content = (data.get("choices", [{}])[0].get("message", {}).get("content") or "").strip()
+        return validate_study_data(json.loads(content))
+    except LLMError as e:
+        raise llm_error_to_service_error(e)
+    except ValueError:
+        raise AIServiceError("The AI did not return valid study data. Please try again.")
+
+
+class _AnswerFilter:
+    """
+    Relays streamed study JSON with the value of every "answer" key left
+    out. Tracks just enough JSON (strings, nesting) to tell where a value
+    ends, whatever way the fragments are split.
+    """
+
+    def __init__(self, on_delta):
+        self.on_delta = on_delta
+        self.in_string = False
+        self.escaped = False
+        self.string = []
+        self.last_string = None
+        self.skipping = False
+        self.depth = 0
+
+    def __call__(self, text):
+        out = []
+        for char in text:
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+                    self.last_string = ''.join(self.string)
+                else:
+                    self.string.append(char)
+                if not self.skipping:
+                    out.append(char)
+                continue
+
+            if self.skipping:
+                if char in ',}]' and not self.depth:
+                    self.skipping = False
+                elif char in '[{':
+                    self.depth += 1
+                elif char in ']}':
+                    self.depth -= 1
+            if char == '"':
+                self.in_string = True
+                self.string = []
+            elif char == ':' and self.last_string == 'answer' and not self.skipping:
+                out.append(char)
+                self.skipping = True
+                self.depth = 0
+                continue
+            elif not char.isspace():
+                self.last_string = None
+            if not self.skipping:
+                out.append(char)
+        if out:
+            self.on_delta(''.join(out))
+
+
+def validate_study_data(data):
+    """
+    Check the model's JSON against the study page schema and normalize it.
+    Malformed questions are dropped; ValueError is raised if nothing usable
+    is left.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("study data must be an object")
+
+    def text_field(value):
+        return value.strip() if isinstance(value, str) else ""
+
+    study = {
+        'title': text_field(data.get('title')) or "Study Page",
+        'summary': text_field(data.get('summary')),
+        'mcq': [],
+        'true_false': [],
+        'fill_in': [],
+    }
+    for item in data.get('mcq') or []:
+        if not isinstance(item, dict):
+            continue
+        options = [text_field(o) for o in item.get('options') or [] if text_field(o)]
+        answer = item.get('answer')
+        if text_field(item.get('question')) and len(options) >= 2 \
+                and isinstance(answer, int) and not isinstance(answer, bool) and 0 <= answer < len(options):
+            study['mcq'].append({'question': text_field(item['question']), 'options': options, 'answer': answer})
+    for item in data.get('true_false') or []:
+        if isinstance(item, dict) and text_field(item.get('statement')) and isinstance(item.get('answer'), bool):
+            study['true_false'].append({'statement': text_field(item['statement']), 'answer': item['answer']})
+    for item in data.get('fill_in') or []:
+        if isinstance(item, dict) and text_field(item.get('prompt')) and text_field(item.get('answer')):
+            study['fill_in'].append({'prompt': text_field(item['prompt']), 'answer': text_field(item['answer'])})
+
+    if not study['summary'] or not (study['mcq'] or study['true_false'] or study['fill_in']):
+        raise ValueError("study data has no summary or no questions")
+    return study
+
+
+def _generate_llm_html(text, max_chars, on_delta=None):
+    if not get_setting('DEEPSEEK_API_KEY'):
+        raise AIServiceError("DeepSeek API key is not configured. Please set DEEPSEEK_API_KEY in your .env file.")
+
+    # Keep input small to reduce drift
+    prompt = build_html_prompt(compact_text(text, max_chars))
+
+    try:
+        data = _complete(prompt, on_delta)
         content = (data.get("choices", [{}])[0].get("message", {}).get("content") or "").strip()
 
         # Strip any accidental code fences
@@ -111,98 +276,33 @@ REMINDER: RETURN ONLY RAW HTML CODE FROM <!DOCTYPE html> TO </html>
   <pre>{escaped}</pre>
 </body>
 </html>"""
-        return fallback_html
-
-    except requests.exceptions.Timeout:
-        return _generate_error_html("Request timed out. Please try again.")
-    except requests.exceptions.ConnectionError:
-        return _generate_error_html("Connection error. Check your internet connection.")
-    except requests.exceptions.RequestException as e:
-        return _generate_error_html(f"Error calling DeepSeek API: {e}")
-    except Exception as e:
-        return _generate_error_html(f"Unexpected error: {e}")
+        raise AIServiceError("The AI did not return a valid HTML document.", page=fallback_html)
 
+    except AIServiceError:
+        raise
+    except LLMError as e:
+        raise llm_error_to_service_error(e)
+    except Exception as e:
+        raise AIServiceError(f"Unexpected error: {e}")
 
 
-    try:
-        # Make API request to DeepSeek
-        url = f"{DEEPSEEK_API_BASE}/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
-        payload = {
-            "model": "deepseek-chat",
-            "messages": [
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            "temperature": 0.7
-        }
-        
-        response = requests.post(url, headers=headers, json=payload, timeout=60)
-        
-        # Check for HTTP errors
-        if response.status_code == 401:
-            error_msg = "Invalid DeepSeek API key. Please check your DEEPSEEK_API_KEY in .env file."
-            return _generate_error_html(error_msg)
-        elif response.status_code == 429:
-            error_msg = "Rate limit exceeded. Please try again later."
-            return _generate_error_html(error_msg)
-        elif response.status_code >= 500:
-            error_msg = "DeepSeek API server error. Please try again later."
-            return _generate_error_html(error_msg)
-        
-        response.raise_for_status()
-        
-        # Parse response
-        response_data = response.json()
-        
-        if "choices" not in response_data or len(response_data["choices"]) == 0:
-            error_msg = "Unexpected response format from DeepSeek API."
-            return _generate_error_html(error_msg)
-        
-        html_output = response_data["choices"][0]["message"]["content"].strip()
-        
-        # Clean up any markdown code fences if they appear
-        if html_output.startswith("```html"):
-            html_output = html_output[7:]
-        if html_output.startswith("```"):
-            html_output = html_output[3:]
-        if html_output.endswith("```"):
-            html_output = html_output[:-3]
-        
-        html_output = html_output.strip()
-        
-        # Validate that it's HTML
-        if not html_output.lower().startswith("<!doctype html>") and not html_output.lower().startswith("<html"):
-            error_msg = "AI did not return valid HTML. Please try again."
-            return _generate_error_html(error_msg)
-        
-        return html_output
-
-    except requests.exceptions.Timeout:
-        error_msg = "Request timed out. The DeepSeek API is taking too long to respond. Please try again."
-        return _generate_error_html(error_msg)
-    
-    except requests.exceptions.ConnectionError:
-        error_msg = "Connection error. Unable to reach DeepSeek API. Please check your internet connection."
-        return _generate_error_html(error_msg)
-    
-    except requests.exceptions.RequestException as e:
-        error_msg = f"Error calling DeepSeek API: {str(e)}"
-        return _generate_error_html(error_msg)
-    
-    except json.JSONDecodeError:
-        error_msg = "Invalid JSON response from DeepSeek API."
-        return _generate_error_html(error_msg)
-    
-    except Exception as e:
-        error_msg = f"Unexpected error: {str(e)}"
-        return _generate_error_html(error_msg)
+def llm_error_to_service_error(e):
+    """Translate an llm_client failure into the message shown to the user."""
+    if isinstance(e, CircuitOpenError):
+        return AIServiceError("DeepSeek API is currently unavailable. Please try again in a minute.")
+    if isinstance(e, LLMTimeoutError):
+        return AIServiceError("Request timed out. Please try again.")
+    if isinstance(e, LLMConnectionError):
+        return AIServiceError("Connection error. Check your internet connection.")
+    if e.status == 401:
+        return AIServiceError("Invalid DeepSeek API key.")
+    if e.status == 402:
+        return AIServiceError("Payment required on DeepSeek API. Add credits or use another model/provider.")
+    if e.status == 429:
+        return AIServiceError("Rate limit exceeded. Please try again later.")
+    if e.status is not None and e.status >= 500:
+        return AIServiceError("DeepSeek API server error. Please try again later.")
+    return AIServiceError(f"Error calling DeepSeek API: {e}")
 
 
 def _generate_error_html(error_message):
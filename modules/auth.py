@@ -3,22 +3,17 @@ from werkzeug.security import generate_password_hash, check_password_hash
 from flask import session
 from functools import wraps
 from flask import redirect, url_for, flash
-
-def get_db_connection():
-    conn = sqlite3.connect('instance/database.sqlite')
-    conn.row_factory = sqlite3.Row
-    return conn
+from modules.db_utils import get_db_connection
 
 def register_user(username, email, password):
     try:
         conn = get_db_connection()
         hashed_password = generate_password_hash(password)
-        conn.execute(
-            'INSERT INTO users (username, email, password) VALUES (?, ?, ?)',
-            (username, email, hashed_password)
-        )
-        conn.commit()
-        conn.close()
+        with conn:
+            conn.execute(
+                'INSERT INTO users (username, email, password) VALUES (?, ?, ?)',
+                (username, email, hashed_password)
+            )
         return True
     except sqlite3.IntegrityError:
         return False
@@ -28,7 +23,6 @@ def login_user(username, password):
     user = conn.execute(
         'SELECT * FROM users WHERE username = ?', (username,)
     ).fetchone()
-    conn.close()
     
     if user and check_password_hash(user['password'], password):
         session['user_id'] = user['id']
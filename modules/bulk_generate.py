@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from modules.pdf_utils import extract_text_from_pdf
+from modules.summary_utils import MAX_DOCUMENT_CHARS
+from modules.generation import create_study_page
+from modules.page_store import resolve_page, pin_page
+from modules.metrics import total
+
+BULK_CONCURRENCY = int(os.getenv("BULK_CONCURRENCY", 4))
+# USD per million tokens, for the cost estimate in the report
+LLM_PRICE_INPUT_PER_M = float(os.getenv("LLM_PRICE_INPUT_PER_M", 0.28))
+LLM_PRICE_OUTPUT_PER_M = float(os.getenv("LLM_PRICE_OUTPUT_PER_M", 0.42))
+DEFAULT_KINDS = ('lectures', 'labs')
+
+
+def find_materials(data_folder, subjects=None, kinds=DEFAULT_KINDS):
+    """Yield (subject, path) for each PDF under data/<subject>/<kind>/."""
+    if not os.path.isdir(data_folder):
+        return
+    for subject in sorted(subjects or os.listdir(data_folder)):
+        for kind in kinds:
+            folder = os.path.join(data_folder, subject, kind)
+            if not os.path.isdir(folder):
+                continue
+            for name in sorted(os.listdir(folder)):
+                if name.lower().endswith('.pdf'):
+                    yield subject, os.path.join(folder, name)
+
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, path):
+    # Written to a temp file and renamed, so an interrupted run never leaves half a manifest
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def _file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _extract(path):
+    # Runs in a worker process
+    start = time.perf_counter()
+    return extract_text_from_pdf(path, max_chars=MAX_DOCUMENT_CHARS), time.perf_counter() - start
+
+
+def bulk_generate(data_folder, generated_folder, manifest_path, subjects=None, kinds=DEFAULT_KINDS,
+                  concurrency=BULK_CONCURRENCY, workers=None, log=print):
+    """
+    Study pages for every PDF in the subject tree, written to
+    `generated_folder` exactly as /process would. PDFs are extracted in a
+    process pool; at most `concurrency` generations talk to the LLM at a
+    time (each with up to AI_MAP_CONCURRENCY calls in flight for long
+    documents). Finished pages are pinned against eviction. Progress is recorded in the manifest after every file, so a rerun
+    skips sources whose content is unchanged and whose page still exists.
+    Returns the report dict.
+    """
+    manifest = load_manifest(manifest_path)
+    manifest_lock = threading.Lock()
+    report = {'files': 0, 'skipped': 0, 'generated': 0, 'cached': 0, 'failed': 0,
+              'extract_seconds': 0.0}
+    tokens_before = (total('llm_prompt_tokens_total'), total('llm_completion_tokens_total'))
+    start = time.perf_counter()
+
+    pending = []
+    for subject, path in find_materials(data_folder, subjects, kinds):
+        report['files'] += 1
+        sha = _file_sha256(path)
+        entry = manifest.get(path)
+        if entry and entry.get('sha256') == sha and entry.get('status') in ('generated', 'cached') \
+                and resolve_page(generated_folder, entry['filename']):
+            report['skipped'] += 1
+            continue
+        pending.append((subject, path, sha))
+
+    def generate(subject, path, sha, text):
+        page_start = time.perf_counter()
+        try:
+            filename, outcome = create_study_page(text, None, generated_folder)
+            if outcome != 'failed':
+                # Course material stays however much users generate (see pin_page)
+                pin_page(filename)
+            error = None
+        except Exception as e:
+            filename, outcome, error = None, 'failed', str(e)
+        seconds = time.perf_counter() - page_start
+        with manifest_lock:
+            report[outcome] += 1
+            manifest[path] = {'subject': subject, 'sha256': sha, 'filename': filename,
+                              'status': outcome, 'error': error, 'seconds': round(seconds, 2),
+                              'finished_at': time.time()}
+            save_manifest(manifest, manifest_path)
+        log(f"{outcome:<9} {os.path.relpath(path, data_folder)} -> {filename or error} ({seconds:.1f}s)")
+
+    extractors = ProcessPoolExecutor(max_workers=workers)
+    generators = ThreadPoolExecutor(max_workers=concurrency)
+    interrupted = False
+    try:
+        extractions = {extractors.submit(_extract, path): (subject, path, sha)
+                       for subject, path, sha in pending}
+        generations = []
+        for future in as_completed(extractions):
+            subject, path, sha = extractions[future]
+            try:
+                text, seconds = future.result()
+            except Exception as e:
+                with manifest_lock:
+                    report['failed'] += 1
+                    manifest[path] = {'subject': subject, 'sha256': sha, 'filename': None,
+                                      'status': 'failed', 'error': f"extraction failed: {e}"}
+                    save_manifest(manifest, manifest_path)
+                log(f"failed    {os.path.relpath(path, data_folder)} -> extraction failed: {e}")
+                continue
+            report['extract_seconds'] += seconds
+            generations.append(generators.submit(generate, subject, path, sha, text))
+        for future in generations:
+            future.result()
+    except KeyboardInterrupt:
+        interrupted = True
+        log("Interrupted; finished files are in the manifest and will be skipped next time.")
+    finally:
+        # Pages already being generated are finished; queued work is dropped
+        extractors.shutdown(wait=True, cancel_futures=interrupted)
+        generators.shutdown(wait=True, cancel_futures=interrupted)
+
+    report['seconds'] = time.perf_counter() - start
+    report['prompt_tokens'] = total('llm_prompt_tokens_total') - tokens_before[0]
+    report['completion_tokens'] = total('llm_completion_tokens_total') - tokens_before[1]
+    report['cost_usd'] = (report['prompt_tokens'] * LLM_PRICE_INPUT_PER_M
+                          + report['completion_tokens'] * LLM_PRICE_OUTPUT_PER_M) / 1e6
+    done = report['generated'] + report['cached']
+    report['pages_per_minute'] = done / report['seconds'] * 60 if report['seconds'] else 0.0
+    return report
+
+
+def format_report(report):
+    return "\n".join([
+        f"{report['files']} source files: {report['generated']} generated, {report['cached']} from cache, "
+        f"{report['skipped']} already done, {report['failed']} failed",
+        f"{report['seconds']:.1f}s wall time, {report['pages_per_minute']:.1f} pages/min, "
+        f"{report['extract_seconds']:.1f}s of PDF extraction",
+        f"{report['prompt_tokens']:,} prompt + {report['completion_tokens']:,} completion tokens, "
+        f"about ${report['cost_usd']:.4f}",
+    ])
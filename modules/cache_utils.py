@@ -0,0 +1,146 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from modules.db_utils import get_db_connection
+from modules.ai_utils import DEEPSEEK_MODEL, TEMPERATURE, PROMPT_VERSION, STUDY_PAGE_FORMAT
+from modules.compression import remove_with_variants
+from modules.page_store import resolve_page
+from modules.metrics import inc
+
+CACHE_MAX_BYTES = int(os.getenv("AI_CACHE_MAX_BYTES", 200 * 1024 * 1024))
+CACHE_MAX_AGE = int(os.getenv("AI_CACHE_MAX_AGE_DAYS", 30)) * 24 * 3600
+
+_stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name, n=1):
+    with _stats_lock:
+        _stats[name] += n
+
+
+def normalize_text(text):
+    """Collapse whitespace so trivially different extractions share a key."""
+    return re.sub(r'\s+', ' ', text or '').strip()
+
+
+def cache_key(text):
+    """
+    Content address for a generation request: the normalized input plus
+    everything else that changes what the model would return.
+    """
+    h = hashlib.sha256()
+    for part in (DEEPSEEK_MODEL, str(TEMPERATURE), PROMPT_VERSION, STUDY_PAGE_FORMAT, normalize_text(text)):
+        h.update(part.encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def get_cached_page(key, folder, count_miss=True):
+    """
+    Return the generated filename stored under `key`, or None on a miss.
+    Entries whose page has disappeared from `folder` are dropped.
+    count_miss=False is for early lookups that are repeated if they miss.
+    """
+    conn = get_db_connection()
+    row = conn.execute(
+        'SELECT filename FROM ai_cache WHERE cache_key = ?', (key,)
+    ).fetchone()
+
+    if row and resolve_page(folder, row['filename']):
+        with conn:
+            conn.execute(
+                'UPDATE ai_cache SET last_used_at = ?, hits = hits + 1 WHERE cache_key = ?',
+                (time.time(), key)
+            )
+        _count('hits')
+        inc('generation_cache_total', result='hit')
+        return row['filename']
+
+    if row:
+        with conn:
+            conn.execute('DELETE FROM ai_cache WHERE cache_key = ?', (key,))
+    if count_miss:
+        _count('misses')
+        inc('generation_cache_total', result='miss')
+    return None
+
+
+def store_cached_page(key, filename, folder):
+    """Record a freshly generated page under `key`, then enforce the limits."""
+    size = os.path.getsize(resolve_page(folder, filename))
+    now = time.time()
+    conn = get_db_connection()
+    with conn:
+        conn.execute(
+            'INSERT OR REPLACE INTO ai_cache (cache_key, filename, size, created_at, last_used_at, hits) '
+            'VALUES (?, ?, ?, ?, ?, 0)',
+            (key, filename, size, now, now)
+        )
+    _count('stores')
+    evict_cache(folder)
+
+
+def evict_cache(folder, max_bytes=None, max_age=None):
+    """
+    Drop entries older than `max_age` seconds, then least recently used
+    entries until the cached pages fit in `max_bytes`. Evicted pages that
+    no user owns are deleted from `folder`; owned ones stay in the page
+    store until its own retention removes them. Entries for pinned pages
+    (modules.page_store.pin_page) are kept and not counted. Returns the
+    number of entries evicted.
+    """
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    max_age = CACHE_MAX_AGE if max_age is None else max_age
+
+    conn = get_db_connection()
+    rows = conn.execute(
+        'SELECT cache_key, filename, size, created_at FROM ai_cache '
+        'WHERE filename NOT IN (SELECT filename FROM pages WHERE pinned = 1) '
+        'ORDER BY last_used_at DESC'
+    ).fetchall()
+
+    cutoff = time.time() - max_age
+    total = 0
+    evicted = []
+    for row in rows:
+        if row['created_at'] < cutoff or total + row['size'] > max_bytes:
+            evicted.append(row)
+        else:
+            total += row['size']
+
+    unowned = [row['filename'] for row in evicted if not conn.execute(
+        'SELECT 1 FROM pages WHERE filename = ? AND owner_id IS NOT NULL', (row['filename'],)
+    ).fetchone()]
+    with conn:
+        conn.executemany(
+            'DELETE FROM ai_cache WHERE cache_key = ?',
+            [(row['cache_key'],) for row in evicted]
+        )
+        conn.executemany('DELETE FROM pages WHERE filename = ?', [(f,) for f in unowned])
+    for filename in unowned:
+        path = resolve_page(folder, filename)
+        if path is not None:
+            remove_with_variants(path)
+
+    if evicted:
+        _count('evictions', len(evicted))
+    return len(evicted)
+
+
+def cache_stats():
+    """Hit/miss counters for this process plus the size of the shared cache."""
+    conn = get_db_connection()
+    row = conn.execute(
+        'SELECT COUNT(*) AS entries, COALESCE(SUM(size), 0) AS bytes FROM ai_cache'
+    ).fetchone()
+
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+    stats['entries'] = row['entries']
+    stats['bytes'] = row['bytes']
+    return stats
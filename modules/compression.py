@@ -0,0 +1,83 @@
+import gzip
+import hashlib
+import os
+import tempfile
+import threading
+
+try:
+    import brotli
+except ImportError:  # optional; gzip alone is enough for every browser
+    brotli = None
+
+# Preferred first when the client accepts several
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')] if brotli else [('gzip', '.gz')]
+VARIANT_SUFFIXES = ('.br', '.gz')
+
+_etags = {}
+_etags_lock = threading.Lock()
+
+
+def write_atomic(path, data):
+    """Write `data` to a temp file beside `path` and rename it over, so readers see all or nothing."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def write_compressed_variants(path, data=None):
+    """
+    Write precompressed copies of a finished file (path.gz and, when the
+    brotli package is installed, path.br), each atomically. `data` is the
+    file's contents when it is not on disk yet. Generated pages never
+    change, so this is done once instead of on every request.
+    """
+    if data is None:
+        with open(path, 'rb') as f:
+            data = f.read()
+    # mtime=0 keeps the output byte-identical for identical input
+    write_atomic(path + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        write_atomic(path + '.br', brotli.compress(data, mode=brotli.MODE_TEXT))
+
+
+def remove_with_variants(path):
+    for suffix in ('',) + VARIANT_SUFFIXES:
+        try:
+            os.remove(path + suffix)
+        except OSError:
+            pass
+
+
+def content_etag(path):
+    """SHA-256 of the file contents, memoized per (path, size, mtime)."""
+    st = os.stat(path)
+    key = (path, st.st_size, st.st_mtime_ns)
+    with _etags_lock:
+        etag = _etags.get(key)
+    if etag is None:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(64 * 1024), b''):
+                h.update(chunk)
+        etag = h.hexdigest()
+        with _etags_lock:
+            if len(_etags) > 10000:
+                _etags.clear()
+            _etags[key] = etag
+    return etag
+
+
+def pick_variant(path, accept_encodings):
+    """
+    Choose the best precompressed file the client accepts.
+    Returns (file path, content encoding or None).
+    """
+    for encoding, suffix in ENCODINGS:
+        if accept_encodings.quality(encoding) > 0 and os.path.exists(path + suffix):
+            return path + suffix, encoding
+    return path, None
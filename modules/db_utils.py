@@ -1,14 +1,85 @@
 import sqlite3
 import os
+import threading
+from config import get_setting
 
-def get_db_connection():
-    os.makedirs('instance', exist_ok=True)
-    conn = sqlite3.connect('instance/database.sqlite')
+# Milliseconds a writer waits for the lock before raising "database is locked"
+DB_BUSY_TIMEOUT = int(os.getenv("DB_BUSY_TIMEOUT", 5000))
+# Negative values are KiB, so this is an 8 MB page cache per connection
+DB_CACHE_SIZE = int(os.getenv("DB_CACHE_SIZE", -8000))
+# Weight of the newest score in quiz_stats.recent_avg (exponential moving average)
+RECENT_WEIGHT = 0.3
+# Stored in PRAGMA user_version; bump whenever init_db creates something new
+SCHEMA_VERSION = 11
+
+_local = threading.local()
+_schema_ready = set()
+
+def _connect(path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=DB_BUSY_TIMEOUT / 1000)
     conn.row_factory = sqlite3.Row
+    # WAL lets dashboard reads run while a quiz score is being written
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.execute(f'PRAGMA busy_timeout = {DB_BUSY_TIMEOUT}')
+    conn.execute(f'PRAGMA cache_size = {DB_CACHE_SIZE}')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    return conn
+
+def get_db_connection():
+    """
+    Return this thread's shared connection to DATABASE_PATH, opening it
+    on first use. Callers must not close it; wrap writes in `with conn:` so
+    they are committed or rolled back as a unit.
+    """
+    conn = getattr(_local, 'conn', None)
+    path = get_setting('DATABASE_PATH')
+    # A connection inherited across fork() must not be reused by the child
+    if conn is None or _local.pid != os.getpid() or _local.path != path:
+        if conn is not None and _local.pid == os.getpid():
+            conn.close()
+        conn = _connect(path)
+        _local.conn = conn
+        _local.pid = os.getpid()
+        _local.path = path
     return conn
 
+def close_db_connection():
+    """Close this thread's connection, if it has one."""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.pid == os.getpid():
+        conn.close()
+    _local.conn = None
+
+def schema_ready():
+    """Whether init_db has prepared the configured database in this process."""
+    return get_setting('DATABASE_PATH') in _schema_ready
+
+def _add_missing_columns(conn, table, columns):
+    """Add the `columns` (name -> type) a table created by an older version lacks. Returns those added."""
+    existing = {row['name'] for row in conn.execute(f'PRAGMA table_info({table})')}
+    added = [name for name in columns if name not in existing]
+    for name in added:
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {name} {columns[name]}')
+    return added
+
 def init_db():
+    """
+    Create the tables and indexes. Idempotent: a database already at
+    SCHEMA_VERSION is left alone, and each database is only checked once
+    per process however many apps are created.
+    """
+    path = get_setting('DATABASE_PATH')
+    if path in _schema_ready:
+        return
     conn = get_db_connection()
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        _schema_ready.add(path)
+        return
     
     conn.execute('''
         CREATE TABLE IF NOT EXISTS users (
@@ -31,17 +102,279 @@ def init_db():
         )
     ''')
     
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_quiz_scores_user_created ON quiz_scores (user_id, created_at)
+    ''')
+    
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS quiz_stats (
+            user_id INTEGER NOT NULL,
+            subject TEXT NOT NULL,
+            attempts INTEGER NOT NULL,
+            total_score INTEGER NOT NULL,
+            best_score INTEGER NOT NULL,
+            last_score INTEGER NOT NULL,
+            recent_avg REAL NOT NULL,
+            last_at TIMESTAMP NOT NULL,
+            PRIMARY KEY (user_id, subject)
+        )
+    ''')
+    
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ai_cache (
+            cache_key TEXT PRIMARY KEY,
+            filename TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            last_used_at REAL NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_ai_cache_last_used ON ai_cache (last_used_at)
+    ''')
+    
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            filename TEXT,
+            error TEXT,
+            enqueued_at REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL,
+            runner TEXT,
+            cache_key TEXT
+        )
+    ''')
+    # runner: the server process whose workers hold the job (see modules.job_queue);
+    # cache_key: the generation it asks for, when known before it is queued
+    _add_missing_columns(conn, 'jobs', {'runner': 'TEXT', 'cache_key': 'TEXT'})
+    
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs (finished_at)
+    ''')
+    
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS quiz_questions (
+            page_id TEXT NOT NULL,
+            qid TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            prompt TEXT NOT NULL,
+            answer TEXT,
+            PRIMARY KEY (page_id, qid)
+        )
+    ''')
+    
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS pdf_texts (
+            sha256 TEXT PRIMARY KEY,
+            text TEXT NOT NULL,
+            max_chars INTEGER,
+            created_at REAL NOT NULL
+        )
+    ''')
+    
+    # Held while one process generates the page for a cache key (single_flight)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS generation_leases (
+            cache_key TEXT PRIMARY KEY,
+            lease_id TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    ''')
+    
+    # Model output of running jobs, readable by every server process (modules.job_stream)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS job_output (
+            job_id TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            PRIMARY KEY (job_id, seq)
+        )
+    ''')
+    
+    # Token buckets for admission control and the global LLM budget (modules.rate_limit)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS rate_buckets (
+            key TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    ''')
+    
+    # Generated pages by owner (modules.page_store); a page served from the cache to
+    # several users has one row per owner, all with the same last_accessed_at. size
+    # covers the compressed variants too and is only counted on the first row, so
+    # SUM(size) is what the files take on disk
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS pages (
+            filename TEXT NOT NULL,
+            owner_id INTEGER,
+            source_hash TEXT,
+            title TEXT,
+            size INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            last_accessed_at REAL NOT NULL,
+            pinned INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (filename, owner_id)
+        )
+    ''')
+    # Pinned pages (course material from bulk-generate) are never evicted
+    if _add_missing_columns(conn, 'pages', {'pinned': 'INTEGER NOT NULL DEFAULT 0'}):
+        # Until then only bulk-generate wrote pages without an owner
+        conn.execute('UPDATE pages SET pinned = 1 WHERE owner_id IS NULL')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_pages_owner ON pages (owner_id, created_at)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_pages_accessed ON pages (last_accessed_at)')
+    if version == 5:
+        # Version 5 repeated the size, and kept its own access time, on every owner's row
+        conn.execute('UPDATE pages SET size = 0 WHERE rowid NOT IN (SELECT MIN(rowid) FROM pages GROUP BY filename)')
+        conn.execute('UPDATE pages SET last_accessed_at = '
+                     '(SELECT MAX(p.last_accessed_at) FROM pages p WHERE p.filename = pages.filename)')
+    
+    # Background services that must run once per deployment, not once per server
+    # process (the search indexer), and the liveness of each process's job
+    # workers (job-runner:<id>); holders keep renewing their leases
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS service_leases (
+            name TEXT PRIMARY KEY,
+            holder TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    ''')
+    
+    # Metric totals of all server processes together (modules.metrics); slot is 0 for
+    # a counter, and a bucket, the count or the sum (last) for a histogram
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS metric_values (
+            name TEXT NOT NULL,
+            labels TEXT NOT NULL,
+            slot INTEGER NOT NULL,
+            value NUMERIC NOT NULL,
+            PRIMARY KEY (name, labels, slot)
+        )
+    ''')
+    
+    # Files seen by the search indexer; mtime/size/hash decide what to re-index
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS search_files (
+            path TEXT PRIMARY KEY,
+            subject TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            mtime REAL NOT NULL,
+            size INTEGER NOT NULL,
+            sha256 TEXT NOT NULL,
+            indexed_at REAL NOT NULL
+        )
+    ''')
+    
+    # One row per PDF page or summary section; start_offset is its position in the file's text
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS search_pages USING fts5(
+            text,
+            path UNINDEXED,
+            subject UNINDEXED,
+            kind UNINDEXED,
+            page UNINDEXED,
+            start_offset UNINDEXED,
+            tokenize = 'porter unicode61'
+        )
+    ''')
+    
     conn.commit()
-    conn.close()
+    
+    # Databases created before quiz_stats existed get their aggregates backfilled
+    has_stats = conn.execute('SELECT 1 FROM quiz_stats LIMIT 1').fetchone()
+    has_scores = conn.execute('SELECT 1 FROM quiz_scores LIMIT 1').fetchone()
+    if has_scores and not has_stats:
+        rebuild_quiz_stats()
+    
+    conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+    _schema_ready.add(path)
 
 def save_quiz_score(user_id, subject, score):
     conn = get_db_connection()
-    conn.execute(
-        'INSERT INTO quiz_scores (user_id, subject, score) VALUES (?, ?, ?)',
-        (user_id, subject, score)
-    )
-    conn.commit()
-    conn.close()
+    with conn:
+        conn.execute(
+            'INSERT INTO quiz_scores (user_id, subject, score) VALUES (?, ?, ?)',
+            (user_id, subject, score)
+        )
+        # Keep the per-subject aggregates in step, in the same transaction
+        conn.execute(
+            '''INSERT INTO quiz_stats
+                   (user_id, subject, attempts, total_score, best_score, last_score, recent_avg, last_at)
+               VALUES (?, ?, 1, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+               ON CONFLICT (user_id, subject) DO UPDATE SET
+                   attempts = attempts + 1,
+                   total_score = total_score + excluded.last_score,
+                   best_score = MAX(best_score, excluded.last_score),
+                   last_score = excluded.last_score,
+                   recent_avg = recent_avg + ? * (excluded.last_score - recent_avg),
+                   last_at = excluded.last_at''',
+            (user_id, subject, score, score, score, score, RECENT_WEIGHT)
+        )
+
+def get_user_stats(user_id):
+    """
+    Per-subject aggregates for a user, read from quiz_stats so the cost does
+    not grow with the number of attempts. `trend` is the recent moving
+    average minus the all-time average: positive means improving.
+    """
+    conn = get_db_connection()
+    rows = conn.execute(
+        '''SELECT subject, attempts, total_score, best_score, last_score, recent_avg, last_at
+           FROM quiz_stats WHERE user_id = ? ORDER BY subject''',
+        (user_id,)
+    ).fetchall()
+    stats = []
+    for row in rows:
+        average = row['total_score'] / row['attempts']
+        stats.append({
+            'subject': row['subject'],
+            'attempts': row['attempts'],
+            'average': round(average, 1),
+            'best': row['best_score'],
+            'last': row['last_score'],
+            'trend': round(row['recent_avg'] - average, 1),
+            'last_at': row['last_at'],
+        })
+    return stats
+
+def rebuild_quiz_stats():
+    """
+    Recompute quiz_stats from the raw quiz_scores table. Returns the row count.
+    Scores are read under the same write lock as the rewrite, so one saved
+    meanwhile cannot be left out of the aggregates.
+    """
+    conn = get_db_connection()
+    aggregates = {}
+    with conn:
+        conn.execute('BEGIN IMMEDIATE')
+        for row in conn.execute(
+            'SELECT user_id, subject, score, created_at FROM quiz_scores ORDER BY id'
+        ):
+            key = (row['user_id'], row['subject'])
+            agg = aggregates.get(key)
+            if agg is None:
+                aggregates[key] = [1, row['score'], row['score'], row['score'], float(row['score']), row['created_at']]
+                continue
+            agg[0] += 1
+            agg[1] += row['score']
+            agg[2] = max(agg[2], row['score'])
+            agg[3] = row['score']
+            agg[4] += RECENT_WEIGHT * (row['score'] - agg[4])
+            agg[5] = row['created_at']
+        
+        conn.execute('DELETE FROM quiz_stats')
+        conn.executemany(
+            '''INSERT INTO quiz_stats
+                   (user_id, subject, attempts, total_score, best_score, last_score, recent_avg, last_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+            [key + tuple(agg) for key, agg in aggregates.items()]
+        )
+    return len(aggregates)
 
 def get_user_scores(user_id):
     conn = get_db_connection()
@@ -49,5 +382,4 @@ def get_user_scores(user_id):
         'SELECT subject, score, created_at FROM quiz_scores WHERE user_id = ? ORDER BY created_at DESC LIMIT 10',
         (user_id,)
     ).fetchall()
-    conn.close()
-    return scores
\ No newline at end of file
+    return scores
@@ -0,0 +1,142 @@
+import uuid
+from datetime import datetime
+from modules.upload_store import extract_upload_text, stored_text_length, stored_upload_text
+from modules.pdf_utils import CHARS_PER_TOKEN, pdf_page_count
+from modules.ai_utils import AIServiceError, STUDY_PAGE_FORMAT
+from modules.summary_utils import generate_document_html, generate_document_data, MAX_DOCUMENT_CHARS
+from modules.quiz_utils import render_study_page, store_question_bank, store_question_bank_from_html
+from modules.cache_utils import cache_key, normalize_text, get_cached_page, store_cached_page
+from modules.page_store import write_page, add_owner
+from modules.metrics import stage
+from modules.job_stream import emit
+from modules.single_flight import single_flight
+from modules.rate_limit import charge_tokens
+
+# Text assumed per PDF page when a job is estimated before its upload is extracted
+CHARS_PER_PAGE_ESTIMATE = 1500
+
+
+class NoTextError(Exception):
+    """The input has no text to generate from; the message is safe to show to the user."""
+
+
+def generate_study_page(user_text, pdf_path, folder, owner_id=None):
+    """
+    Full /process pipeline: extract the PDF (if any, as stored by
+    save_upload), reuse a cached page or ask the AI for a new one, and
+    store it in `folder` (modules.page_store) as one of `owner_id`'s pages.
+    Returns the generated filename. Runs without a request context so it can
+    be executed by the job queue workers.
+    """
+    return create_study_page(user_text, pdf_path, folder, owner_id)[0]
+
+
+def estimate_prompt_tokens(user_text, pdf_path):
+    """
+    Rough prompt tokens a generation will spend, known before the job runs
+    (for fair scheduling): from the pasted text, the
+    upload's stored extraction, or else its page count. Capped at the
+    document budget.
+    """
+    if not pdf_path:
+        chars = len(user_text or "")
+    else:
+        chars = stored_text_length(pdf_path)
+        if chars is None:
+            try:
+                chars = pdf_page_count(pdf_path) * CHARS_PER_PAGE_ESTIMATE
+            except Exception:
+                # Unreadable: the job will report why; charge it the full budget meanwhile
+                chars = MAX_DOCUMENT_CHARS
+    return min(chars, MAX_DOCUMENT_CHARS) // CHARS_PER_TOKEN
+
+
+def request_cache_key(user_text, pdf_path):
+    """
+    The cache key create_study_page will use, if it can be known without
+    extracting the upload (pasted text, or an upload extracted before).
+    Otherwise None, as for input without text (create_study_page rejects it).
+    """
+    if pdf_path:
+        user_text = stored_upload_text(pdf_path, max_chars=MAX_DOCUMENT_CHARS)
+    if not normalize_text(user_text):
+        return None
+    return cache_key(user_text)
+
+
+def find_cached_page(key, folder, owner_id=None):
+    """
+    The cached page for `key`, now also one of `owner_id`'s pages, or None.
+    Lets a request that was generated before skip the job queue.
+    """
+    cached = get_cached_page(key, folder, count_miss=False)
+    if cached:
+        add_owner(folder, cached, owner_id)
+    return cached
+
+
+def create_study_page(user_text, pdf_path, folder, owner_id=None):
+    """
+    generate_study_page that also says how the page was made: returns
+    (filename, outcome) with outcome 'cached', 'generated', or 'failed'
+    when the file holds an error or recovery page. Raises NoTextError for
+    empty input, e.g. a scanned PDF without a text layer.
+    """
+    if pdf_path:
+        # Nothing past the map-reduce document budget is used, so stop extracting there
+        with stage('extract'):
+            user_text = extract_upload_text(pdf_path, max_chars=MAX_DOCUMENT_CHARS)
+
+    # All empty inputs would share one cache key, and the model has nothing to work from
+    if not normalize_text(user_text):
+        if pdf_path:
+            raise NoTextError("No extractable text was found in this PDF. Scanned or image-only "
+                              "PDFs are not supported; please paste the text instead.")
+        raise NoTextError("No extractable text was given. Please paste some text or upload a PDF.")
+
+    # Reuse an identical earlier generation instead of calling the AI again
+    with stage('cache_lookup'):
+        key = cache_key(user_text)
+        cached = get_cached_page(key, folder)
+    if cached:
+        add_owner(folder, cached, owner_id)
+        return cached, 'cached'
+
+    # Identical requests already in flight share one generation
+    filename, outcome = single_flight(key, folder, lambda: _generate_page(user_text, key, folder, owner_id))
+    add_owner(folder, filename, owner_id)
+    return filename, outcome
+
+
+def _generate_page(user_text, key, folder, owner_id):
+    if owner_id is not None:
+        # Only generations that reach the LLM count against the user's token budget
+        charge_tokens(owner_id, min(len(user_text), MAX_DOCUMENT_CHARS) // CHARS_PER_TOKEN)
+
+    # Create unique filename with timestamp; it doubles as the quiz page id
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    unique_id = str(uuid.uuid4())[:8]
+    filename = f"study_page_{timestamp}_{unique_id}.html"
+
+    # Generate from AI; only clean results are cached
+    try:
+        with stage('generate'):
+            if STUDY_PAGE_FORMAT == "json":
+                study = generate_document_data(user_text, on_delta=emit)
+                html_output = render_study_page(study, page_id=filename)
+                store_question_bank(filename, study)
+            else:
+                html_output = generate_document_html(user_text, on_delta=emit)
+                store_question_bank_from_html(filename, html_output)
+        cacheable = True
+    except AIServiceError as e:
+        html_output = e.page
+        cacheable = False
+
+    with stage('write'):
+        write_page(folder, filename, html_output, owner_id, key)
+
+    if cacheable:
+        store_cached_page(key, filename, folder)
+
+    return filename, 'generated' if cacheable else 'failed'
@@ -0,0 +1,286 @@
+import queue
+import threading
+import time
+import uuid
+import logging
+from collections import deque
+from config import get_setting
+from modules.db_utils import get_db_connection
+from modules.metrics import inc, observe, start_trace, end_trace
+from modules.job_stream import open_stream, bind_stream, close_stream
+
+# Finished jobs are kept this long so late status polls still resolve
+JOB_RETENTION = 24 * 3600
+# A server process's workers count as gone once their lease is this old; renewed 3x as often
+RUNNER_LEASE_SECONDS = 30
+
+logger = logging.getLogger(__name__)
+
+_workers = []
+_workers_lock = threading.Lock()
+
+_stats_lock = threading.Lock()
+_stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'rejected': 0, 'running': 0}
+_wait_times = deque(maxlen=500)
+_run_times = deque(maxlen=500)
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue already holds JOB_QUEUE_SIZE pending jobs."""
+
+
+class FairQueue:
+    """
+    Jobs queued per user and handed out by deficit round robin instead of
+    first come, first served. Each user with queued jobs gets `quantum`
+    estimated tokens of credit per turn and keeps its turn while the credit
+    covers its next job, so a user with many (or large) jobs gets the same
+    share as one with a single small job, and a burst of light users is not
+    stuck behind a heavy one.
+    """
+
+    def __init__(self, maxsize, quantum):
+        self.maxsize = maxsize
+        self.quantum = quantum
+        self._pending = {}   # user -> deque of (cost, item)
+        self._deficit = {}   # user -> credit left this turn
+        self._turns = deque()  # users with queued jobs, the one being served first
+        self._size = 0
+        self._changed = threading.Condition()
+
+    def put_nowait(self, user, item, cost=1):
+        with self._changed:
+            if self._size >= self.maxsize:
+                raise queue.Full
+            if user not in self._pending:
+                self._pending[user] = deque()
+                self._deficit[user] = 0
+                self._turns.append(user)
+                if len(self._turns) == 1:
+                    self._deficit[user] = self.quantum
+            self._pending[user].append((max(1, cost), item))
+            self._size += 1
+            self._changed.notify()
+
+    def get(self):
+        with self._changed:
+            while not self._size:
+                self._changed.wait()
+            while True:
+                user = self._turns[0]
+                pending = self._pending[user]
+                cost, item = pending[0]
+                if cost <= self._deficit[user]:
+                    pending.popleft()
+                    self._size -= 1
+                    self._deficit[user] -= cost
+                    if not pending:
+                        # Unused credit is not banked while a user is idle
+                        self._turns.popleft()
+                        del self._pending[user], self._deficit[user]
+                        self._next_turn()
+                    return item
+                self._turns.rotate(-1)
+                self._next_turn()
+
+    def _next_turn(self):
+        if self._turns:
+            self._deficit[self._turns[0]] += self.quantum
+
+    def qsize(self):
+        with self._changed:
+            return self._size
+
+    def users(self):
+        with self._changed:
+            return len(self._turns)
+
+
+_queue = None
+_runner_id = None
+
+
+def _start_workers():
+    # Started on first use rather than at import so forked servers get
+    # their own threads, sized by the config of the app being served
+    global _queue, _runner_id
+    with _workers_lock:
+        if _queue is not None:
+            return
+        _runner_id = uuid.uuid4().hex
+        _renew_runner()
+        threading.Thread(target=_heartbeat, name="job-runner-heartbeat", daemon=True).start()
+        _queue = FairQueue(get_setting('JOB_QUEUE_SIZE'), get_setting('JOB_QUANTUM_TOKENS'))
+        for i in range(get_setting('JOB_WORKERS')):
+            t = threading.Thread(target=_worker, name=f"job-worker-{i}", daemon=True)
+            t.start()
+            _workers.append(t)
+
+
+def _renew_runner():
+    """
+    Renew this process's job-runner lease, which tells the other server
+    processes its queued and running jobs are still alive (see get_job).
+    """
+    now = time.time()
+    conn = get_db_connection()
+    with conn:
+        conn.execute("DELETE FROM service_leases WHERE name LIKE 'job-runner:%' AND expires_at < ?", (now,))
+        conn.execute('INSERT OR REPLACE INTO service_leases (name, holder, expires_at) VALUES (?, ?, ?)',
+                     (f'job-runner:{_runner_id}', _runner_id, now + RUNNER_LEASE_SECONDS))
+
+
+def _heartbeat():
+    while True:
+        time.sleep(RUNNER_LEASE_SECONDS / 3)
+        try:
+            _renew_runner()
+        except Exception:
+            logger.exception("Renewing the job runner lease failed")
+
+
+def _runner_alive(runner):
+    if runner is None:
+        return False
+    conn = get_db_connection()
+    row = conn.execute('SELECT 1 FROM service_leases WHERE name = ? AND expires_at >= ?',
+                       (f'job-runner:{runner}', time.time())).fetchone()
+    return row is not None
+
+
+def submit_job(user_id, func, *args, cost=1, key=None):
+    """
+    Queue `func(*args)` for a worker thread. `func` must return the
+    generated filename. Returns the new job id immediately.
+    Jobs are scheduled fairly between users (see FairQueue); `cost` is the
+    job's estimated prompt tokens and `key` its generation cache key, if
+    known (see find_job).
+    Output the job emit()s can be read by any server process with
+    read_stream (modules.job_stream).
+    """
+    _start_workers()
+    job_id = uuid.uuid4().hex
+    now = time.time()
+
+    conn = get_db_connection()
+    with conn:
+        conn.execute('DELETE FROM jobs WHERE finished_at < ?', (now - JOB_RETENTION,))
+        conn.execute(
+            'INSERT INTO jobs (id, user_id, status, enqueued_at, runner, cache_key) VALUES (?, ?, ?, ?, ?, ?)',
+            (job_id, user_id, 'queued', now, _runner_id, key)
+        )
+
+    open_stream(job_id)
+    try:
+        _queue.put_nowait(user_id, (job_id, now, func, args), cost)
+    except queue.Full:
+        _finish(job_id, 'failed', error='Server is busy, please try again shortly.')
+        with _stats_lock:
+            _stats['rejected'] += 1
+        raise QueueFullError(job_id)
+
+    with _stats_lock:
+        _stats['submitted'] += 1
+    return job_id
+
+
+def get_job(job_id):
+    """
+    The job's row, or None. A queued or running job whose server process
+    has stopped (its runner lease expired, e.g. after a restart) is marked
+    failed here, so its page stops waiting for it.
+    """
+    conn = get_db_connection()
+    job = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+    if job is not None and job['status'] in ('queued', 'running') and not _runner_alive(job['runner']):
+        _finish(job_id, 'failed', error='The server restarted before this job finished. Please try again.')
+        job = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+    return job
+
+
+def find_job(user_id, key):
+    """The id of `user_id`'s queued or running job for cache key `key`, or None."""
+    conn = get_db_connection()
+    rows = conn.execute(
+        "SELECT id, runner FROM jobs WHERE user_id = ? AND cache_key = ? AND status IN ('queued', 'running')",
+        (user_id, key)
+    ).fetchall()
+    for row in rows:
+        if _runner_alive(row['runner']):
+            return row['id']
+    return None
+
+
+def _finish(job_id, status, filename=None, error=None):
+    conn = get_db_connection()
+    with conn:
+        conn.execute(
+            'UPDATE jobs SET status = ?, filename = ?, error = ?, finished_at = ? WHERE id = ?',
+            (status, filename, error, time.time(), job_id)
+        )
+
+
+def _worker():
+    while True:
+        job_id, enqueued_at, func, args = _queue.get()
+        started = time.time()
+        with _stats_lock:
+            _stats['running'] += 1
+            _wait_times.append(started - enqueued_at)
+
+        conn = get_db_connection()
+        with conn:
+            conn.execute(
+                'UPDATE jobs SET status = ?, started_at = ? WHERE id = ?',
+                ('running', started, job_id)
+            )
+
+        start_trace(f"job {job_id}")
+        bind_stream(job_id)
+        try:
+            filename = func(*args)
+            _finish(job_id, 'done', filename=filename)
+            outcome = 'completed'
+        except Exception as e:
+            logger.exception("Job %s failed", job_id)
+            _finish(job_id, 'failed', error=str(e))
+            outcome = 'failed'
+        finally:
+            close_stream(job_id)
+            bind_stream(None)
+            end_trace()
+            with _stats_lock:
+                _stats['running'] -= 1
+                _run_times.append(time.time() - started)
+
+        with _stats_lock:
+            _stats[outcome] += 1
+        inc('jobs_total', outcome=outcome)
+        observe('job_seconds', time.time() - started)
+
+
+def _summary(samples):
+    if not samples:
+        return {'avg': 0.0, 'p95': 0.0, 'max': 0.0}
+    ordered = sorted(samples)
+    return {
+        'avg': sum(ordered) / len(ordered),
+        'p95': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        'max': ordered[-1],
+    }
+
+
+def queue_stats():
+    """
+    Queue depth (and how many users it holds), worker usage and recent
+    wait/run times (seconds) for this process.
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+        stats['wait_seconds'] = _summary(list(_wait_times))
+        stats['run_seconds'] = _summary(list(_run_times))
+    stats['depth'] = _queue.qsize() if _queue is not None else 0
+    stats['waiting_users'] = _queue.users() if _queue is not None else 0
+    stats['capacity'] = get_setting('JOB_QUEUE_SIZE')
+    stats['workers'] = get_setting('JOB_WORKERS')
+    return stats
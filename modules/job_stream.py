@@ -0,0 +1,72 @@
+import threading
+import time
+from modules.db_utils import get_db_connection
+
+# Finished streams are kept this long so a page opened late can still replay them
+STREAM_RETENTION = 120
+# Model output is written out at most this often, one row per flush
+FLUSH_INTERVAL = 0.5
+
+_local = threading.local()
+
+
+def open_stream(job_id):
+    """Start a job's output stream, dropping streams that finished long ago."""
+    conn = get_db_connection()
+    with conn:
+        conn.execute(
+            'DELETE FROM job_output WHERE job_id NOT IN '
+            '(SELECT id FROM jobs WHERE finished_at IS NULL OR finished_at >= ?)',
+            (time.time() - STREAM_RETENTION,)
+        )
+
+
+def bind_stream(job_id):
+    """Send emit() calls on this thread to the job's stream (None to stop)."""
+    _local.job_id = job_id
+    _local.parts = []
+    _local.seq = 0
+    _local.flushed_at = time.monotonic()
+
+
+def emit(text):
+    """
+    Append model output to the stream of the job running on this thread,
+    if any. Buffered and written to SQLite every FLUSH_INTERVAL, so every
+    server process can read it (read_stream).
+    """
+    if getattr(_local, 'job_id', None) is None:
+        return
+    _local.parts.append(text)
+    if time.monotonic() - _local.flushed_at >= FLUSH_INTERVAL:
+        _flush()
+
+
+def _flush():
+    _local.flushed_at = time.monotonic()
+    if not _local.parts:
+        return
+    _local.seq += 1
+    conn = get_db_connection()
+    with conn:
+        conn.execute('INSERT INTO job_output (job_id, seq, text) VALUES (?, ?, ?)',
+                     (_local.job_id, _local.seq, ''.join(_local.parts)))
+    _local.parts = []
+
+
+def close_stream(job_id):
+    """Write out what the job on this thread emitted since the last flush."""
+    if getattr(_local, 'job_id', None) == job_id:
+        _flush()
+
+
+def read_stream(job_id, offset):
+    """The job's output past `offset`, as (text, new offset). Never waits."""
+    conn = get_db_connection()
+    rows = conn.execute(
+        'SELECT seq, text FROM job_output WHERE job_id = ? AND seq > ? ORDER BY seq',
+        (job_id, offset)
+    ).fetchall()
+    if not rows:
+        return '', offset
+    return ''.join(row['text'] for row in rows), rows[-1]['seq']
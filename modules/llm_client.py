@@ -0,0 +1,749 @@
+import asyncio
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from modules.metrics import inc, stage, record_usage
+from modules.pdf_utils import CHARS_PER_TOKEN
+from modules.rate_limit import acquire_llm_budget
+from config import get_setting
+
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 60))
+LLM_POOL_CONNECTIONS = int(os.getenv("LLM_POOL_CONNECTIONS", 4))
+LLM_POOL_MAXSIZE = int(os.getenv("LLM_POOL_MAXSIZE", 16))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 3))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", 0.5))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", 8))
+# A Retry-After longer than this is not worth holding a worker for
+LLM_RETRY_AFTER_MAX = float(os.getenv("LLM_RETRY_AFTER_MAX", 30))
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", 5))
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", 30))
+# Alternate OpenAI-compatible backends tried after DeepSeek, e.g. "openai,groq". Each is
+# configured by LLM_<NAME>_API_BASE, LLM_<NAME>_API_KEY and LLM_<NAME>_MODEL
+LLM_FALLBACK_PROVIDERS = [n.strip() for n in os.getenv("LLM_FALLBACK_PROVIDERS", "").split(",") if n.strip()]
+# Send a duplicate request to the next provider when the first has not answered
+# (or streamed its first token) within this percentile of its recent latencies
+LLM_HEDGE = os.getenv("LLM_HEDGE", "1") == "1"
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", 95))
+# Hedge delay used until a provider has LLM_HEDGE_MIN_SAMPLES latencies on record
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", 2))
+LLM_HEDGE_MIN_DELAY = 0.25
+LLM_HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 200
+LATENCY_EWMA_ALPHA = 0.2
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+logger = logging.getLogger(__name__)
+
+
+class LLMError(Exception):
+    """A chat completion call failed. `status` is the HTTP status, if any."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class LLMTimeoutError(LLMError):
+    pass
+
+
+class LLMConnectionError(LLMError):
+    pass
+
+
+class CircuitOpenError(LLMError):
+    """Raised without calling upstream while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive upstream failures and rejects calls
+    for `reset_after` seconds, then lets a single trial call through
+    (half-open) to decide whether to close again.
+    """
+
+    def __init__(self, threshold=LLM_BREAKER_THRESHOLD, reset_after=LLM_BREAKER_RESET):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_after:
+            return 'half_open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self._state()
+            if state == 'closed':
+                return True
+            if state == 'half_open' and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial_running or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self.trial_running = False
+
+    def release_trial(self):
+        """A call ended without an outcome (e.g. it lost a hedge): let another trial through."""
+        with self._lock:
+            self.trial_running = False
+
+
+class Provider:
+    """
+    One OpenAI-compatible chat backend with its own circuit breaker and a
+    record of how fast it answers. `model` replaces the model a caller
+    asks for (None keeps it). Latencies are kept apart for streamed calls
+    (time to the first token) and plain ones (time to the whole body).
+    """
+
+    def __init__(self, name, api_base, api_key, model=None):
+        self.name = name
+        self.url = f"{api_base.rstrip('/')}/chat/completions"
+        self.api_key = api_key
+        self.model = model
+        self.breaker = CircuitBreaker()
+        self._latencies = {True: deque(maxlen=LATENCY_WINDOW), False: deque(maxlen=LATENCY_WINDOW)}
+        self._ewma = {True: None, False: None}
+        self._lock = threading.Lock()
+
+    def headers(self):
+        return {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+
+    def record_latency(self, streamed, seconds):
+        with self._lock:
+            self._latencies[streamed].append(seconds)
+            self._update_ewma(streamed, seconds)
+
+    def record_failure(self, streamed):
+        # Counted as a full timeout in the average only, so a failing backend
+        # loses the primary spot without inflating its hedge delay
+        with self._lock:
+            self._update_ewma(streamed, LLM_TIMEOUT)
+
+    def _update_ewma(self, streamed, seconds):
+        previous = self._ewma[streamed]
+        self._ewma[streamed] = seconds if previous is None else previous + LATENCY_EWMA_ALPHA * (seconds - previous)
+
+    def ewma(self, streamed):
+        with self._lock:
+            return self._ewma[streamed]
+
+    def hedge_delay(self, streamed):
+        """Seconds to wait for this provider before hedging: a high percentile of its latencies."""
+        with self._lock:
+            recent = sorted(self._latencies[streamed])
+        if len(recent) < LLM_HEDGE_MIN_SAMPLES:
+            return LLM_HEDGE_DELAY
+        index = min(len(recent) - 1, int(len(recent) * LLM_HEDGE_PERCENTILE / 100))
+        return max(LLM_HEDGE_MIN_DELAY, recent[index])
+
+
+def _configured_providers():
+    found = [Provider('deepseek', get_setting('DEEPSEEK_API_BASE'), get_setting('DEEPSEEK_API_KEY'))]
+    for name in LLM_FALLBACK_PROVIDERS:
+        prefix = f"LLM_{name.upper()}_"
+        api_base = os.getenv(prefix + "API_BASE")
+        if not api_base:
+            logger.warning("Ignoring LLM provider %s: %sAPI_BASE is not set", name, prefix)
+            continue
+        found.append(Provider(name, api_base, os.getenv(prefix + "API_KEY"), os.getenv(prefix + "MODEL")))
+    return found
+
+
+_providers = None
+_providers_lock = threading.Lock()
+
+_session = None
+_session_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {'calls': 0, 'attempts': 0, 'retries': 0, 'failures': 0, 'short_circuited': 0,
+          'hedged': 0, 'hedges_won': 0, 'fallbacks': 0}
+
+
+class _Cancelled(Exception):
+    """The other request of a hedged pair won; this one stops quietly."""
+
+
+def get_providers():
+    """The providers in configured order, DeepSeek first; built from the settings on first use."""
+    global _providers
+    if _providers is None:
+        with _providers_lock:
+            if _providers is None:
+                _providers = _configured_providers()
+    return _providers
+
+
+def _count(name, n=1):
+    with _stats_lock:
+        _stats[name] += n
+
+
+def _failover(event):
+    _count(event)
+    inc('llm_failover_total', event=event)
+
+
+def get_session():
+    """The shared keep-alive session; connections are pooled per host."""
+    global _session
+    if _session is None:
+        # requests is imported on first use to keep startup light
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=LLM_POOL_CONNECTIONS,
+                                      pool_maxsize=LLM_POOL_MAXSIZE)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.headers.update({"Content-Type": "application/json"})
+                _session = session
+    return _session
+
+
+def _retry_after(value):
+    """Parse a Retry-After header (seconds or HTTP date) into seconds."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff(attempt, retry_after=None):
+    """
+    Seconds to wait before retry number `attempt` (1-based): full-jitter
+    exponential backoff, but never less than the server's Retry-After.
+    Returns None when Retry-After asks for longer than we are willing to wait.
+    """
+    delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+    if retry_after is not None:
+        if retry_after > LLM_RETRY_AFTER_MAX:
+            return None
+        delay = max(delay, retry_after)
+    return delay
+
+
+def _payload(provider, messages, model, temperature, extra):
+    payload = {"model": provider.model or model, "messages": messages, "temperature": temperature}
+    payload.update(extra)
+    return payload
+
+
+def _pick(streamed, tried):
+    """
+    The provider to send the next request to: the fastest one on record
+    not yet tried whose breaker lets a call through. Providers without a
+    record keep their configured order behind the measured ones.
+    """
+    providers = get_providers()
+    ranked = sorted(
+        (p for p in providers if p not in tried),
+        key=lambda p: (p.ewma(streamed) is None, p.ewma(streamed) or 0.0, providers.index(p))
+    )
+    for provider in ranked:
+        if provider.breaker.allow():
+            return provider
+    return None
+
+
+def _prompt_tokens(messages):
+    return sum(len(m.get('content') or '') for m in messages) // CHARS_PER_TOKEN
+
+
+def _wait_for_budget(tokens, cancelled):
+    """
+    Block until one attempt of about `tokens` prompt tokens fits the global
+    LLM budget (modules.rate_limit), which charges it.
+    """
+    with stage('llm_budget_wait'):
+        while True:
+            wait = acquire_llm_budget(tokens)
+            if not wait:
+                return
+            if cancelled.wait(wait):
+                raise _Cancelled()
+
+
+async def _await_budget(tokens):
+    """_wait_for_budget for the async client."""
+    with stage('llm_budget_wait'):
+        while True:
+            wait = acquire_llm_budget(tokens)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+
+def _hedged(run, streamed, on_delta=None):
+    """
+    Call `run(provider, cancelled, events)` on the best provider. If it has
+    not answered (streamed: produced a token) within that provider's hedge
+    delay, the same call is started on the next provider too. Each run
+    reports ('delta', text), ('done', body) or ('error', LLMError) on
+    `events`; the first provider to produce output wins and the other is
+    cancelled. When a provider fails before producing anything, the next
+    one is tried. Deltas of the winner are passed to on_delta on the
+    calling thread.
+    """
+    events = queue.Queue()
+    tried = []
+    running = {}  # provider -> (cancelled event, start time)
+
+    def launch():
+        provider = _pick(streamed, tried)
+        if provider is None:
+            return False
+        tried.append(provider)
+        cancelled = threading.Event()
+        running[provider] = (cancelled, time.monotonic())
+        threading.Thread(target=run, args=(provider, cancelled, events),
+                         name=f"llm-{provider.name}", daemon=True).start()
+        return True
+
+    _count('calls')
+    if not launch():
+        _count('short_circuited')
+        inc('llm_requests_total', outcome='short_circuited')
+        raise CircuitOpenError("DeepSeek API is temporarily unavailable.")
+
+    hedge = LLM_HEDGE and len(get_providers()) > 1
+    hedge_at = time.monotonic() + tried[0].hedge_delay(streamed) if hedge else None
+    winner = None
+    hedged_to = None
+    error = None
+    while running:
+        try:
+            provider, kind, value = events.get(
+                timeout=None if hedge_at is None else max(0.0, hedge_at - time.monotonic()))
+        except queue.Empty:
+            hedge_at = None
+            if launch():
+                hedged_to = tried[-1]
+                _failover('hedged')
+            continue
+        if provider not in running or (winner is not None and provider is not winner):
+            continue  # a cancelled loser finishing late
+
+        if kind == 'error':
+            del running[provider]
+            provider.record_failure(streamed)
+            if provider is winner:
+                raise value  # output was already handed to on_delta
+            error = value
+            if not running and launch():
+                hedge_at = None
+                _failover('fallbacks')
+            continue
+
+        if winner is None:
+            winner = provider
+            hedge_at = None
+            provider.record_latency(streamed, time.monotonic() - running[provider][1])
+            for other, (cancelled, _) in running.items():
+                if other is not provider:
+                    cancelled.set()
+            if provider is hedged_to:
+                _failover('hedges_won')
+        if kind == 'delta':
+            on_delta(value)
+        else:
+            return value
+    raise error
+
+
+def chat_completion(messages, model, temperature, timeout=LLM_TIMEOUT, **extra):
+    """
+    POST to /chat/completions over the pooled session, retrying 429/5xx,
+    timeouts and connection errors with jittered exponential backoff,
+    hedged and failed over across providers (see _hedged). Every attempt
+    sent, retries and hedges included, first waits until it fits the
+    global LLM budget. A losing hedge cannot
+    be interrupted mid-request: it runs to completion (at most `timeout`)
+    on its own thread and pooled connection, and its answer is discarded.
+    Returns the decoded JSON body or raises an LLMError subclass.
+    """
+    def run(provider, cancelled, events):
+        try:
+            events.put((provider, 'done', _post(provider, cancelled, messages, model, temperature, timeout, extra)))
+        except LLMError as e:
+            events.put((provider, 'error', e))
+        except _Cancelled:
+            provider.breaker.release_trial()
+            inc('llm_requests_total', provider=provider.name, outcome='cancelled')
+        except Exception as e:
+            # Must still report, or _hedged would wait for this provider forever
+            events.put((provider, 'error', _unexpected(provider, e)))
+
+    with stage('llm_call'):
+        return _hedged(run, streamed=False)
+
+
+def _post(provider, cancelled, messages, model, temperature, timeout, extra):
+    import requests
+
+    payload = _payload(provider, messages, model, temperature, extra)
+    tokens = _prompt_tokens(messages)
+    attempt = 0
+    while True:
+        attempt += 1
+        _wait_for_budget(tokens, cancelled)
+        _count('attempts')
+        retry_after = None
+        try:
+            r = get_session().post(provider.url, json=payload, headers=provider.headers(), timeout=timeout)
+            if cancelled.is_set():
+                raise _Cancelled()
+            if r.status_code < 400:
+                data = r.json()
+                provider.breaker.record_success()
+                _succeeded(provider, data)
+                return data
+            error = LLMError(f"{provider.name} API returned HTTP {r.status_code}.", status=r.status_code)
+            retry_after = _retry_after(r.headers.get('Retry-After'))
+        except requests.exceptions.Timeout:
+            error = LLMTimeoutError("Request timed out.")
+        except requests.exceptions.ConnectionError:
+            error = LLMConnectionError(f"Could not connect to {provider.name} API.")
+        except requests.exceptions.RequestException as e:
+            error = LLMError(f"Error calling {provider.name} API: {e}")
+
+        if cancelled.is_set():
+            raise _Cancelled()
+        error = _after_failure(provider, error, attempt, retry_after)
+        if isinstance(error, LLMError):
+            raise error
+        if cancelled.wait(error):
+            raise _Cancelled()
+
+
+def stream_chat_completion(messages, model, temperature, on_delta, timeout=LLM_TIMEOUT, **extra):
+    """
+    chat_completion with `stream: true`: calls on_delta(text) for every
+    content fragment as it arrives and returns a body shaped like the
+    non-streamed one (full message content plus usage). Failures before the
+    first fragment are retried (and hedged) like chat_completion; once text
+    has been handed to on_delta a retry would repeat it, so later failures
+    raise.
+    """
+    def run(provider, cancelled, events):
+        try:
+            events.put((provider, 'done', _post_stream(provider, cancelled, events, messages, model,
+                                                       temperature, timeout, extra)))
+        except LLMError as e:
+            events.put((provider, 'error', e))
+        except _Cancelled:
+            provider.breaker.release_trial()
+            inc('llm_requests_total', provider=provider.name, outcome='cancelled')
+        except Exception as e:
+            # Must still report, or _hedged would wait for this provider forever
+            events.put((provider, 'error', _unexpected(provider, e)))
+
+    with stage('llm_call'):
+        return _hedged(run, streamed=True, on_delta=on_delta)
+
+
+def _post_stream(provider, cancelled, events, messages, model, temperature, timeout, extra):
+    import requests
+
+    payload = _payload(provider, messages, model, temperature,
+                       dict(extra, stream=True, stream_options={"include_usage": True}))
+    tokens = _prompt_tokens(messages)
+    attempt = 0
+    while True:
+        attempt += 1
+        _wait_for_budget(tokens, cancelled)
+        _count('attempts')
+        retry_after = None
+        parts = []
+        try:
+            with get_session().post(provider.url, json=payload, headers=provider.headers(),
+                                    timeout=timeout, stream=True) as r:
+                if r.status_code < 400:
+                    data = _read_event_stream(r, parts, lambda text: events.put((provider, 'delta', text)),
+                                              cancelled)
+                    provider.breaker.record_success()
+                    _succeeded(provider, data)
+                    return data
+                error = LLMError(f"{provider.name} API returned HTTP {r.status_code}.", status=r.status_code)
+                retry_after = _retry_after(r.headers.get('Retry-After'))
+        except requests.exceptions.Timeout:
+            error = LLMTimeoutError("Request timed out.")
+        except requests.exceptions.ConnectionError:
+            error = LLMConnectionError(f"Could not connect to {provider.name} API.")
+        except requests.exceptions.RequestException as e:
+            error = LLMError(f"Error calling {provider.name} API: {e}")
+
+        if cancelled.is_set():
+            raise _Cancelled()
+        if parts:
+            provider.breaker.record_failure()
+            _count('failures')
+            inc('llm_requests_total', provider=provider.name, outcome='error')
+            raise error
+        error = _after_failure(provider, error, attempt, retry_after)
+        if isinstance(error, LLMError):
+            raise error
+        if cancelled.wait(error):
+            raise _Cancelled()
+
+
+def _read_event_stream(response, parts, on_delta, cancelled=None):
+    """
+    Collect the content fragments of a server-sent event stream into
+    `parts`. Raises _Cancelled (which closes the connection) as soon as
+    `cancelled` is set.
+    """
+    usage = None
+    finish_reason = None
+    for line in response.iter_lines():
+        if cancelled is not None and cancelled.is_set():
+            raise _Cancelled()
+        if not line.startswith(b'data:'):
+            continue
+        data = line[5:].strip()
+        if data == b'[DONE]':
+            break
+        try:
+            event = json.loads(data)
+        except ValueError:
+            continue
+        usage = event.get('usage') or usage
+        for choice in event.get('choices') or []:
+            finish_reason = choice.get('finish_reason') or finish_reason
+            text = (choice.get('delta') or {}).get('content')
+            if text:
+                parts.append(text)
+                on_delta(text)
+    return {
+        "choices": [{"index": 0, "finish_reason": finish_reason,
+                     "message": {"role": "assistant", "content": "".join(parts)}}],
+        "usage": usage or {},
+    }
+
+
+async def achat_completion(http, messages, model, temperature, **extra):
+    """
+    Async twin of chat_completion for an aiohttp session made by
+    create_async_session. Shares the retry policy, providers, breakers,
+    global budget (charged per attempt) and counters; hedging cancels the
+    losing request's task outright.
+    """
+    _count('calls')
+    tried = []
+    tasks = {}  # task -> (provider, start time)
+
+    def launch():
+        provider = _pick(False, tried)
+        if provider is None:
+            return False
+        tried.append(provider)
+        task = asyncio.ensure_future(_apost(http, provider, messages, model, temperature, extra))
+        tasks[task] = (provider, time.monotonic())
+        return True
+
+    if not launch():
+        _count('short_circuited')
+        inc('llm_requests_total', outcome='short_circuited')
+        raise CircuitOpenError("DeepSeek API is temporarily unavailable.")
+
+    hedge_delay = tried[0].hedge_delay(False) if LLM_HEDGE and len(get_providers()) > 1 else None
+    hedged_to = None
+    error = None
+    with stage('llm_call'):
+        while tasks:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_delay, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                hedge_delay = None
+                if launch():
+                    hedged_to = tried[-1]
+                    _failover('hedged')
+                continue
+            for task in done:
+                provider, started = tasks.pop(task)
+                try:
+                    data = task.result()
+                except LLMError as e:
+                    provider.record_failure(False)
+                    error = e
+                    continue
+                provider.record_latency(False, time.monotonic() - started)
+                if provider is hedged_to:
+                    _failover('hedges_won')
+                for loser, (other, _) in tasks.items():
+                    loser.cancel()
+                    inc('llm_requests_total', provider=other.name, outcome='cancelled')
+                return data
+            if not tasks and launch():
+                hedge_delay = None
+                _failover('fallbacks')
+    raise error
+
+
+async def _apost(http, provider, messages, model, temperature, extra):
+    try:
+        return await _apost_attempts(http, provider, messages, model, temperature, extra)
+    except asyncio.CancelledError:
+        # Lost a hedge: whatever this call was, it settled nothing about the provider
+        provider.breaker.release_trial()
+        raise
+
+
+async def _apost_attempts(http, provider, messages, model, temperature, extra):
+    import aiohttp
+
+    payload = _payload(provider, messages, model, temperature, extra)
+    tokens = _prompt_tokens(messages)
+    attempt = 0
+    while True:
+        attempt += 1
+        await _await_budget(tokens)
+        _count('attempts')
+        retry_after = None
+        try:
+            async with http.post(provider.url, json=payload, headers=provider.headers()) as r:
+                if r.status < 400:
+                    data = await r.json(content_type=None)
+                    provider.breaker.record_success()
+                    _succeeded(provider, data)
+                    return data
+                error = LLMError(f"{provider.name} API returned HTTP {r.status}.", status=r.status)
+                retry_after = _retry_after(r.headers.get('Retry-After'))
+        except asyncio.TimeoutError:
+            error = LLMTimeoutError("Request timed out.")
+        except aiohttp.ClientConnectionError:
+            error = LLMConnectionError(f"Could not connect to {provider.name} API.")
+        except aiohttp.ClientError as e:
+            error = LLMError(f"Error calling {provider.name} API: {e}")
+
+        error = _after_failure(provider, error, attempt, retry_after)
+        if isinstance(error, LLMError):
+            raise error
+        await asyncio.sleep(error)
+
+
+def _unexpected(provider, error):
+    """An LLMError for a failure outside the client's handling, e.g. a malformed body."""
+    logger.exception("Unexpected error calling %s API", provider.name)
+    provider.breaker.record_failure()
+    _count('failures')
+    inc('llm_requests_total', provider=provider.name, outcome='error')
+    return LLMError(f"Unexpected response from {provider.name} API: {error!r}")
+
+
+def _succeeded(provider, data):
+    inc('llm_requests_total', provider=provider.name, outcome='ok')
+    record_usage(data)
+
+
+def _reason(error):
+    if error.status is not None:
+        return str(error.status)
+    if isinstance(error, LLMTimeoutError):
+        return 'timeout'
+    if isinstance(error, LLMConnectionError):
+        return 'connection'
+    return 'other'
+
+
+def _after_failure(provider, error, attempt, retry_after):
+    """
+    Book-keeping shared by the clients. Returns the delay before the next
+    attempt, or the error to raise when the call should not be retried.
+    """
+    retryable = error.status is None or error.status in RETRY_STATUSES
+    if retryable and error.status != 429:
+        # Rate limiting means upstream is alive; only outages trip the breaker
+        provider.breaker.record_failure()
+    elif error.status == 429:
+        provider.breaker.record_success()
+
+    if not retryable or attempt > LLM_MAX_RETRIES:
+        _count('failures')
+        inc('llm_requests_total', provider=provider.name, outcome='error')
+        return error
+    delay = _backoff(attempt, retry_after)
+    if delay is None or not provider.breaker.allow():
+        _count('failures')
+        inc('llm_requests_total', provider=provider.name, outcome='error')
+        return error
+    _count('retries')
+    inc('llm_retries_total', provider=provider.name, reason=_reason(error))
+    return delay
+
+
+def create_async_session(concurrency):
+    """aiohttp session with a connector capped at `concurrency` connections."""
+    import aiohttp
+
+    return aiohttp.ClientSession(
+        timeout=aiohttp.ClientTimeout(total=LLM_TIMEOUT),
+        connector=aiohttp.TCPConnector(limit=concurrency),
+    )
+
+
+def client_stats():
+    """
+    Call, retry, hedging and breaker counters plus connection reuse for
+    this process, and each provider's breaker state and average latency.
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    providers = get_providers()
+    # The DeepSeek breaker
+    stats['breaker_state'] = providers[0].breaker.state
+    stats['providers'] = {
+        p.name: {'breaker_state': p.breaker.state, 'latency': p.ewma(False),
+                 'first_token_latency': p.ewma(True)}
+        for p in providers
+    }
+    stats['connections_opened'] = 0
+    stats['pooled_requests'] = 0
+    if _session is not None:
+        for adapter in set(_session.adapters.values()):
+            for key in list(adapter.poolmanager.pools.keys()):
+                pool = adapter.poolmanager.pools.get(key)
+                if pool is not None:
+                    stats['connections_opened'] += pool.num_connections
+                    stats['pooled_requests'] += pool.num_requests
+    reused = stats['pooled_requests'] - stats['connections_opened']
+    stats['connection_reuse_ratio'] = reused / stats['pooled_requests'] if stats['pooled_requests'] else 0.0
+    return stats
@@ -0,0 +1,255 @@
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from modules.db_utils import get_db_connection, schema_ready
+
+# Requests (or jobs) slower than this are logged with their stage breakdown; 0 disables
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", 0))
+# Each process adds what it recorded to the shared metric_values table at most this
+# often, so a scrape served by any server process reports the deployment's totals
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", 5))
+
+PREFIX = "studyapp_"
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+# name -> (type, help, buckets)
+METRICS = {
+    'http_requests_total': ('counter', "HTTP requests by endpoint and status.", None),
+    'http_request_seconds': ('histogram', "HTTP request latency by endpoint.", SECONDS_BUCKETS),
+    'stage_seconds': ('histogram', "Time spent in each hot-path stage.", SECONDS_BUCKETS),
+    'jobs_total': ('counter', "Generation jobs by outcome.", None),
+    'job_seconds': ('histogram', "Generation job run time.", SECONDS_BUCKETS),
+    'llm_requests_total': ('counter', "LLM calls by provider and outcome.", None),
+    'llm_retries_total': ('counter', "LLM retries by provider and reason.", None),
+    'llm_failover_total': ('counter', "Hedged requests, hedges that won and fallbacks to another provider.", None),
+    'llm_prompt_tokens_total': ('counter', "Prompt tokens reported by the LLM API.", None),
+    'llm_completion_tokens_total': ('counter', "Completion tokens reported by the LLM API.", None),
+    'llm_completion_tokens': ('histogram', "Completion tokens per LLM call.", TOKEN_BUCKETS),
+    'prompt_compaction_tokens_total': ('counter', "Estimated document tokens before and after prompt compaction.", None),
+    'rate_limited_total': ('counter', "Generations refused (user) or LLM calls held back (global) by a rate budget.", None),
+    'generation_cache_total': ('counter', "Generated page cache lookups by result.", None),
+    'generation_coalesced_total': ('counter', "Generations that waited on an identical one in flight.", None),
+    'extraction_cache_total': ('counter', "PDF text cache lookups by result.", None),
+}
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_pending = {}  # recorded since the last flush: key -> counter amount, or histogram counts
+_flushed_at = time.monotonic()
+_local = threading.local()
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def _add(store, key, value):
+    if isinstance(value, list):
+        counts = store.setdefault(key, [0] * (len(value) - 1) + [0.0])
+        for i, v in enumerate(value):
+            counts[i] += v
+    else:
+        store[key] = store.get(key, 0) + value
+
+
+def inc(name, amount=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _add(_counters, key, amount)
+        _add(_pending, key, amount)
+    if time.monotonic() - _flushed_at >= METRICS_FLUSH_SECONDS:
+        flush()
+
+
+def total(name, **labels):
+    """Sum of a counter, in this process, over every label set that includes `labels`."""
+    wanted = set(labels.items())
+    with _lock:
+        return sum(value for (metric, key), value in _counters.items()
+                   if metric == name and wanted <= set(key))
+
+
+def observe(name, value, **labels):
+    buckets = METRICS[name][2]
+    # one count per bucket, then +Inf, sum
+    counts = [int(value <= bound) for bound in buckets] + [1, value]
+    key = _key(name, labels)
+    with _lock:
+        _add(_histograms, key, counts)
+        _add(_pending, key, counts)
+    if time.monotonic() - _flushed_at >= METRICS_FLUSH_SECONDS:
+        flush()
+
+
+def flush():
+    """
+    Add what this process recorded since the last flush to the totals
+    shared by every server process. Kept for the next flush if the
+    database cannot take it, or was never set up (scripts, tests).
+    """
+    global _pending, _flushed_at
+    if not schema_ready():
+        _flushed_at = time.monotonic()
+        return
+    with _lock:
+        pending, _pending = _pending, {}
+        _flushed_at = time.monotonic()
+    if not pending:
+        return
+    rows = []
+    for (name, labels), value in pending.items():
+        values = value if isinstance(value, list) else [value]
+        rows.extend((name, json.dumps(labels), slot, v) for slot, v in enumerate(values) if v)
+    try:
+        conn = get_db_connection()
+        with conn:
+            conn.executemany(
+                'INSERT INTO metric_values (name, labels, slot, value) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (name, labels, slot) DO UPDATE SET value = value + excluded.value',
+                rows
+            )
+    except sqlite3.Error:
+        logger.warning("Could not write metrics to the database", exc_info=True)
+        with _lock:
+            for key, value in pending.items():
+                _add(_pending, key, value)
+
+
+atexit.register(flush)
+# Anything recorded before a fork is the parent's to flush, not every child's
+os.register_at_fork(after_in_child=lambda: _pending.clear())
+
+
+def _shared():
+    """(counters, histograms) of every server process together."""
+    flush()
+    counters, histograms = {}, {}
+    conn = get_db_connection()
+    for row in conn.execute('SELECT name, labels, slot, value FROM metric_values'):
+        if row['name'] not in METRICS:
+            continue
+        kind, _, buckets = METRICS[row['name']]
+        key = (row['name'], tuple(tuple(pair) for pair in json.loads(row['labels'])))
+        if kind == 'counter':
+            counters[key] = row['value']
+        else:
+            histograms.setdefault(key, [0] * (len(buckets) + 1) + [0.0])[row['slot']] = row['value']
+    return counters, histograms
+
+
+@contextmanager
+def stage(name):
+    """Time a block into stage_seconds and the current trace, if any."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        observe('stage_seconds', elapsed, stage=name)
+        trace = getattr(_local, 'trace', None)
+        if trace is not None:
+            trace['stages'].append((name, elapsed))
+
+
+def start_trace(label):
+    """Begin collecting stage timings for the work on this thread."""
+    _local.trace = {'label': label, 'start': time.perf_counter(), 'stages': []}
+
+
+def end_trace():
+    """
+    Stop the current trace and log it when slower than SLOW_REQUEST_SECONDS.
+    Returns the total seconds, or None when no trace was running.
+    """
+    trace = getattr(_local, 'trace', None)
+    if trace is None:
+        return None
+    _local.trace = None
+    total = time.perf_counter() - trace['start']
+    if SLOW_REQUEST_SECONDS and total >= SLOW_REQUEST_SECONDS:
+        breakdown = ", ".join(f"{name}={seconds * 1000:.0f}ms" for name, seconds in trace['stages'])
+        logger.warning("Slow %s: %.0fms (%s)", trace['label'], total * 1000, breakdown or "no stages")
+    return total
+
+
+def record_usage(data):
+    """Count the token usage reported in a chat completion response body."""
+    usage = (data or {}).get('usage') or {}
+    prompt = usage.get('prompt_tokens') or 0
+    completion = usage.get('completion_tokens') or 0
+    if prompt:
+        inc('llm_prompt_tokens_total', prompt)
+    if completion:
+        inc('llm_completion_tokens_total', completion)
+        observe('llm_completion_tokens', completion)
+
+
+def _labels(labels, extra=None):
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(gauges=None, process_gauges=None):
+    """
+    Everything recorded so far, by every server process, in the Prometheus
+    text format (only this process's without the database).
+    `gauges` maps extra metric names to (value, help) for point-in-time
+    values; `process_gauges` likewise for values that only describe this
+    process, which are labelled with its pid.
+    """
+    shared = None
+    if schema_ready():
+        try:
+            shared = _shared()
+        except sqlite3.Error:
+            logger.warning("Could not read shared metrics, reporting this process only", exc_info=True)
+    if shared is not None:
+        counters, histograms = shared
+    else:
+        with _lock:
+            counters = dict(_counters)
+            histograms = {key: list(counts) for key, counts in _histograms.items()}
+
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        full = PREFIX + name
+        lines.append(f"# HELP {full} {help_text}")
+        lines.append(f"# TYPE {full} {kind}")
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{full}{_labels(labels)} {_number(value)}")
+            continue
+        for (metric, labels), counts in sorted(histograms.items()):
+            if metric != name:
+                continue
+            for bound, count in zip(buckets, counts):
+                lines.append(f"{full}_bucket{_labels(labels, ('le', bound))} {count}")
+            lines.append(f"{full}_bucket{_labels(labels, ('le', '+Inf'))} {counts[-2]}")
+            lines.append(f"{full}_count{_labels(labels)} {counts[-2]}")
+            lines.append(f"{full}_sum{_labels(labels)} {_number(counts[-1])}")
+
+    pid = (('pid', os.getpid()),)
+    for labels, values in (((), gauges), (pid, process_gauges)):
+        for name, (value, help_text) in (values or {}).items():
+            full = PREFIX + name
+            lines.append(f"# HELP {full} {help_text}")
+            lines.append(f"# TYPE {full} gauge")
+            lines.append(f"{full}{_labels(labels)} {_number(value)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,179 @@
+import hashlib
+import logging
+import os
+import re
+import time
+from werkzeug.security import safe_join
+from modules.db_utils import get_db_connection
+from modules.compression import write_atomic, write_compressed_variants, remove_with_variants, VARIANT_SUFFIXES
+
+# Generated pages (all variants) are evicted, least recently viewed first, above this size
+PAGE_STORE_MAX_BYTES = int(os.getenv("PAGE_STORE_MAX_MB", 1024)) * 1024 * 1024
+# last_accessed_at is only rewritten when older than this, so views rarely write
+TOUCH_INTERVAL = 300
+USER_PAGES_LIMIT = 20
+
+logger = logging.getLogger(__name__)
+
+_TITLE = re.compile(r'<title>(.*?)</title>', re.I | re.S)
+
+
+def _shard(filename):
+    return hashlib.sha256(filename.encode('utf-8')).hexdigest()[:2]
+
+
+def page_path(folder, filename):
+    """Where a page is stored: a subdirectory picked by the hash of its name."""
+    return safe_join(folder, _shard(filename), filename)
+
+
+def resolve_page(folder, filename):
+    """
+    The file serving `filename`: its sharded path, or for pages written
+    before sharding, the flat one. None when neither exists (or the name
+    tries to leave `folder`).
+    """
+    for path in (page_path(folder, filename), safe_join(folder, filename)):
+        if path is not None and os.path.isfile(path):
+            return path
+    return None
+
+
+def _disk_size(path):
+    size = 0
+    for suffix in ('',) + VARIANT_SUFFIXES:
+        try:
+            size += os.path.getsize(path + suffix)
+        except OSError:
+            pass
+    return size
+
+
+def write_page(folder, filename, html, owner_id=None, source_hash=None):
+    """
+    Store a finished page and index it. The compressed variants are
+    written first and every file is renamed into place whole, so a reader
+    never sees a partial page. Pages above PAGE_STORE_MAX_BYTES are then
+    evicted. Returns the path.
+    """
+    path = page_path(folder, filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    data = html.encode('utf-8')
+    write_compressed_variants(path, data)
+    write_atomic(path, data)
+
+    match = _TITLE.search(html)
+    title = re.sub(r'\s+', ' ', match.group(1)).strip() if match else None
+    now = time.time()
+    conn = get_db_connection()
+    with conn:
+        conn.execute(
+            'INSERT OR REPLACE INTO pages (filename, owner_id, source_hash, title, size, created_at, last_accessed_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (filename, owner_id, source_hash, title, _disk_size(path), now, now)
+        )
+    enforce_retention(folder)
+    return path
+
+
+def add_owner(folder, filename, owner_id):
+    """
+    List an existing page (e.g. a cache hit) among `owner_id`'s pages too.
+    Counts as an access to it.
+    """
+    if owner_id is None:
+        return
+    now = time.time()
+    conn = get_db_connection()
+    with conn:
+        # The file is already counted in the first owner's size
+        cursor = conn.execute(
+            'INSERT OR IGNORE INTO pages (filename, owner_id, source_hash, title, size, created_at, last_accessed_at) '
+            'SELECT filename, ?, source_hash, title, 0, ?, ? FROM pages WHERE filename = ? LIMIT 1',
+            (owner_id, now, now, filename)
+        )
+        if cursor.rowcount or conn.execute('SELECT 1 FROM pages WHERE filename = ?', (filename,)).fetchone():
+            conn.execute('UPDATE pages SET last_accessed_at = ? WHERE filename = ?', (now, filename))
+        else:
+            # A page from before the index: record what the file says
+            path = resolve_page(folder, filename)
+            if path is not None:
+                conn.execute(
+                    'INSERT OR IGNORE INTO pages (filename, owner_id, size, created_at, last_accessed_at) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (filename, owner_id, _disk_size(path), now, now)
+                )
+
+
+def pin_page(filename):
+    """
+    Keep a page for good: it is exempt from the page store's retention and
+    the generation cache's eviction (see modules.cache_utils).
+    """
+    conn = get_db_connection()
+    with conn:
+        conn.execute('UPDATE pages SET pinned = 1 WHERE filename = ?', (filename,))
+
+
+def touch_page(filename):
+    """
+    Note that a page was viewed, for retention. Only a read unless the
+    last noted view is older than TOUCH_INTERVAL, so views rarely write.
+    """
+    now = time.time()
+    conn = get_db_connection()
+    row = conn.execute('SELECT last_accessed_at FROM pages WHERE filename = ? LIMIT 1', (filename,)).fetchone()
+    if row is None or row['last_accessed_at'] >= now - TOUCH_INTERVAL:
+        return
+    with conn:
+        conn.execute('UPDATE pages SET last_accessed_at = ? WHERE filename = ?', (now, filename))
+
+
+def user_pages(owner_id, limit=USER_PAGES_LIMIT):
+    """A user's pages, newest first."""
+    conn = get_db_connection()
+    return conn.execute(
+        "SELECT filename, title, datetime(created_at, 'unixepoch') AS created FROM pages "
+        'WHERE owner_id = ? ORDER BY created_at DESC LIMIT ?',
+        (owner_id, limit)
+    ).fetchall()
+
+
+def enforce_retention(folder, max_bytes=None):
+    """
+    Delete the least recently viewed pages until the indexed pages fit in
+    `max_bytes`, together with their cache entries and question banks.
+    Pinned pages are neither counted nor deleted. Returns the number of
+    pages deleted.
+    """
+    max_bytes = PAGE_STORE_MAX_BYTES if max_bytes is None else max_bytes
+    conn = get_db_connection()
+    pinned = {row['filename'] for row in conn.execute('SELECT filename FROM pages WHERE pinned = 1')}
+    total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM pages').fetchone()[0]
+    if pinned:
+        total -= conn.execute('SELECT COALESCE(SUM(size), 0) FROM pages WHERE filename IN '
+                              '(SELECT filename FROM pages WHERE pinned = 1)').fetchone()[0]
+    if total <= max_bytes:
+        return 0
+
+    # Oldest first along idx_pages_accessed; a page shared by several owners goes as a whole
+    evicted = []
+    for row in conn.execute('SELECT filename FROM pages ORDER BY last_accessed_at'):
+        if total <= max_bytes:
+            break
+        if row['filename'] in evicted or row['filename'] in pinned:
+            continue
+        evicted.append(row['filename'])
+        total -= conn.execute('SELECT SUM(size) FROM pages WHERE filename = ?', (row['filename'],)).fetchone()[0]
+
+    params = [(filename,) for filename in evicted]
+    with conn:
+        conn.executemany('DELETE FROM pages WHERE filename = ?', params)
+        conn.executemany('DELETE FROM ai_cache WHERE filename = ?', params)
+        conn.executemany('DELETE FROM quiz_questions WHERE page_id = ?', params)
+    for filename in evicted:
+        path = resolve_page(folder, filename)
+        if path is not None:
+            remove_with_variants(path)
+    logger.info("Evicted %d generated pages to stay under %d bytes", len(evicted), max_bytes)
+    return len(evicted)
@@ -1,8 +1,79 @@
-import fitz  # PyMuPDF
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# Rough chars-per-token ratio for English text, used for token budgets
+CHARS_PER_TOKEN = 4
+# Written between pages by extract_text_from_pdf, so later stages can tell pages apart
+PAGE_BREAK = "\f"
+# Documents shorter than this are always extracted serially
+PARALLEL_MIN_PAGES = 64
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", 0))
+
+
+def iter_pdf_pages(path, start=0, stop=None):
+    """Yield the text of each page in [start, stop) one at a time."""
+    import fitz  # PyMuPDF; imported on first use, it is slow to load
+
+    with fitz.open(path) as doc:
+        stop = doc.page_count if stop is None else min(stop, doc.page_count)
+        for number in range(start, stop):
+            yield doc.load_page(number).get_text()
+
+
+def pdf_page_count(path):
+    import fitz
 
-def extract_text_from_pdf(path):
-    text = ""
     with fitz.open(path) as doc:
-        for page in doc:
-            text += page.get_text()
-    return text
+        return doc.page_count
+
+
+def _extract_range(path, start, stop):
+    # Runs in a worker process, so it opens its own document handle
+    return list(iter_pdf_pages(path, start, stop))
+
+
+def _iter_pages_parallel(path, page_count, workers):
+    chunk = max(1, -(-page_count // (workers * 4)))
+    ranges = [(start, min(start + chunk, page_count)) for start in range(0, page_count, chunk)]
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        futures = [executor.submit(_extract_range, path, start, stop) for start, stop in ranges]
+        for future in futures:
+            yield from future.result()
+    finally:
+        # Stopping early (budget reached) drops the ranges nobody needs
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def extract_text_from_pdf(path, max_chars=None, max_tokens=None, workers=None):
+    """
+    Extract the text of a PDF, pages separated by PAGE_BREAK, stopping as
+    soon as `max_chars` characters (or roughly `max_tokens` tokens) have
+    been collected.
+    With `workers` > 1, documents of PARALLEL_MIN_PAGES pages or more are
+    split into page ranges and extracted by a process pool.
+    """
+    if max_tokens is not None:
+        token_chars = max_tokens * CHARS_PER_TOKEN
+        max_chars = token_chars if max_chars is None else min(max_chars, token_chars)
+    workers = PDF_EXTRACT_WORKERS if workers is None else workers
+
+    pages = None
+    if workers and workers > 1:
+        page_count = pdf_page_count(path)
+        if page_count >= PARALLEL_MIN_PAGES:
+            pages = _iter_pages_parallel(path, page_count, workers)
+    if pages is None:
+        pages = iter_pdf_pages(path)
+
+    parts = []
+    length = 0
+    for page_text in pages:
+        parts.append(page_text)
+        length += len(page_text) + len(PAGE_BREAK)
+        if max_chars is not None and length >= max_chars:
+            pages.close()
+            break
+
+    text = PAGE_BREAK.join(parts)
+    return text if max_chars is None else text[:max_chars]
@@ -0,0 +1,146 @@
+import heapq
+import math
+import os
+import re
+from collections import Counter
+from modules.pdf_utils import PAGE_BREAK
+
+# Set to 0 to send the extracted text as-is (the first characters up to the budget)
+PROMPT_COMPACTION = os.getenv("PROMPT_COMPACTION", "1") == "1"
+# A line is slide boilerplate when it is on at least this share of the pages (and on 3 or more)
+REPEATED_LINE_SHARE = 0.5
+# Longer lines are content even when repeated
+REPEATED_LINE_MAX_CHARS = 120
+# Sentences shorter than this many words are scored as if they had this many,
+# so bare fragments do not win on density alone
+MIN_SENTENCE_WORDS = 8
+# Weight left on a term each time a selected sentence covers it
+REDUNDANCY_DECAY = 0.5
+
+STOP_WORDS = frozenset("""
+a about above after again all also an and any are as at be because been before being
+below between both but by can could did do does doing down during each few for from
+further had has have having here how if in into is it its itself just more most no nor
+not now of off on once only or other our out over own same should so some such than that
+the their them then there these they this those through to too under until up very was
+we were what when where which while who whom why will with would you your
+""".split())
+
+_SPACES = re.compile(r'[ \t\r\v\u00a0]+')
+_PAGE_NUMBER = re.compile(r'^(?:page|slide|p\.)?\s*\d{1,4}(?:\s*(?:/|of)\s*\d{1,4})?$', re.I)
+_DIGITS = re.compile(r'\d+')
+_SENTENCE_BREAK = re.compile(r'(?<=[.!?;])\s+')
+_WORD = re.compile(r'[^\W\d_][\w\-]+')
+
+
+def clean_text(text):
+    """
+    Normalize whitespace and drop page numbers and lines that repeat on
+    most pages (slide headers and footers). Pages are separated by
+    PAGE_BREAK, as extract_text_from_pdf writes them; text without page
+    breaks only loses exact lines seen three times or more.
+    """
+    pages = []
+    for page in (text or "").split(PAGE_BREAK):
+        lines = (_SPACES.sub(' ', line).strip() for line in page.split('\n'))
+        pages.append([line for line in lines if line and not _PAGE_NUMBER.match(line)])
+
+    if len(pages) >= 3:
+        # Digits are ignored so "Lecture 4 - page 12" matches on every page
+        seen_on = Counter()
+        for lines in pages:
+            seen_on.update({_DIGITS.sub('#', line) for line in lines if len(line) <= REPEATED_LINE_MAX_CHARS})
+        threshold = max(3, math.ceil(REPEATED_LINE_SHARE * len(pages)))
+        boilerplate = {key for key, count in seen_on.items() if count >= threshold}
+        pages = [[line for line in lines if _DIGITS.sub('#', line) not in boilerplate] for lines in pages]
+    else:
+        counts = Counter(line for lines in pages for line in lines if len(line) <= REPEATED_LINE_MAX_CHARS)
+        pages = [[line for line in lines if counts[line] < 3] for lines in pages]
+
+    return "\n".join(line for lines in pages for line in lines)
+
+
+def _terms(sentence):
+    return [word for word in (w.lower() for w in _WORD.findall(sentence)) if word not in STOP_WORDS]
+
+
+def select_salient(text, max_chars):
+    """
+    Keep the sentences carrying the most information per character until
+    `max_chars` is reached, in their original order. Sentences are scored
+    by TF-IDF: terms frequent in the document but rare across sentences
+    weigh most, and a term's weight decays each time a kept sentence
+    covers it, so repeated statements are not picked twice. Sentences with
+    the same terms as an earlier one (differing only in numbers or stop
+    words) are dropped outright.
+    """
+    if len(text) <= max_chars:
+        return text
+
+    units = []  # (line number, sentence)
+    terms = []
+    seen = set()
+    for number, line in enumerate(text.split('\n')):
+        for sentence in _SENTENCE_BREAK.split(line):
+            words = _terms(sentence)
+            key = frozenset(words)
+            if sentence and key not in seen:
+                seen.add(key)
+                units.append((number, sentence))
+                terms.append(words)
+
+    in_document = Counter(term for unit in terms for term in unit)
+    in_sentences = Counter(term for unit in terms for term in set(unit))
+    count = len(units)
+    weight = {term: (1 + math.log(n)) * math.log((1 + count) / in_sentences[term])
+              for term, n in in_document.items()}
+
+    def score(i):
+        words = max(MIN_SENTENCE_WORDS, len(units[i][1].split()))
+        return sum(weight[term] for term in set(terms[i])) / words
+
+    # Lazy greedy: scores only go down as weights decay, so a sentence whose
+    # fresh score still tops the heap is the best one left
+    heap = [(-score(i), i) for i in range(count) if terms[i]]
+    heapq.heapify(heap)
+    chosen = set()
+    size = 0
+    while heap:
+        _, i = heapq.heappop(heap)
+        fresh = score(i)
+        if heap and fresh < -heap[0][0]:
+            heapq.heappush(heap, (-fresh, i))
+            continue
+        length = len(units[i][1]) + 1
+        if size + length > max_chars:
+            continue
+        chosen.add(i)
+        size += length
+        for term in set(terms[i]):
+            weight[term] *= REDUNDANCY_DECAY
+    if not chosen:
+        return text[:max_chars]
+
+    lines = []
+    last_line = None
+    for i in sorted(chosen):
+        number, sentence = units[i]
+        if number == last_line:
+            lines[-1] += " " + sentence
+        else:
+            lines.append(sentence)
+        last_line = number
+    return "\n".join(lines)
+
+
+def compact_text(text, max_chars=None):
+    """
+    The prompt-ready form of extracted text: clean_text, then cut down to
+    `max_chars` by select_salient. With PROMPT_COMPACTION off this is just
+    the first `max_chars` characters.
+    """
+    text = text or ""
+    if not PROMPT_COMPACTION:
+        return text if max_chars is None else text[:max_chars]
+    text = clean_text(text)
+    return text if max_chars is None else select_salient(text, max_chars)
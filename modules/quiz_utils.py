@@ -1,43 +1,153 @@
+import os
+from html.parser import HTMLParser
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from modules.db_utils import get_db_connection
+
+_TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'templates')
+# Standalone environment so pages can be rendered by job workers and the CLI,
+# outside any Flask application context
+_env = Environment(loader=FileSystemLoader(_TEMPLATE_DIR), autoescape=select_autoescape(['html']))
+
 def grade_quiz(answers, correct_answers):
     """
-    Grade a quiz by comparing user answers with correct answers.
+    Grade quiz submissions by comparing user answers with correct answers.
     
     Args:
-        answers: dict of question_id: user_answer
+        answers: dict of question_id: user_answer, or a list of such dicts
+            to grade a batch of submissions against the same key
         correct_answers: dict of question_id: correct_answer
     
     Returns:
-        tuple: (score, total, percentage)
+        tuple: (score, total, percentage), or a list of tuples for a batch
     """
-    if not answers or not correct_answers:
+    # Normalized once, however many submissions are graded against it
+    key = {qid: str(correct).strip().lower() for qid, correct in (correct_answers or {}).items()}
+    if isinstance(answers, list):
+        return [_grade_one(submission, key) for submission in answers]
+    return _grade_one(answers, key)
+
+def _grade_one(answers, key):
+    if not answers or not key:
         return 0, 0, 0
     
     score = 0
-    total = len(correct_answers)
+    total = len(key)
     
-    for question_id, correct_answer in correct_answers.items():
-        user_answer = answers.get(question_id, '').strip().lower()
-        if user_answer == str(correct_answer).strip().lower():
+    for question_id, correct_answer in key.items():
+        user_answer = str(answers.get(question_id) or '').strip().lower()
+        if user_answer == correct_answer:
             score += 1
     
     percentage = (score / total * 100) if total > 0 else 0
     return score, total, percentage
 
+def grade_page_submissions(page_id, submissions):
+    """
+    Grade many submissions for one generated page against its stored answer
+    key, loaded once. Returns a list of (score, total, percentage); total is
+    0 when the page has no gradable questions.
+    """
+    return grade_quiz(list(submissions), get_answer_key(page_id))
+
+class _QuizHTMLParser(HTMLParser):
+    """Collects the text of every <div class="question">, including nested markup."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.questions = []
+        self._depth = 0  # open <div>s inside the current question
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if self._depth:
+            if tag == 'div':
+                self._depth += 1
+            if tag in ('input', 'textarea', 'select') and not self.questions[-1]['field']:
+                self.questions[-1]['field'] = attrs.get('name') or attrs.get('id')
+        elif tag == 'div' and 'question' in (attrs.get('class') or '').split():
+            self._depth = 1
+            self.questions.append({'id': len(self.questions) + 1, 'content': [], 'field': None})
+
+    def handle_endtag(self, tag):
+        if self._depth and tag == 'div':
+            self._depth -= 1
+
+    def handle_data(self, data):
+        if self._depth:
+            self.questions[-1]['content'].append(data)
+
 def parse_quiz_html(html_content):
     """
-    Parse quiz HTML to extract questions and answers.
-    Returns a structured dict of quiz data.
+    Parse quiz HTML to extract the questions in a single pass.
+    Returns a list of {'id', 'content', 'field'} dicts, where `field` is the
+    name of the first input inside the question (if any).
     """
-    import re
+    parser = _QuizHTMLParser()
+    parser.feed(html_content or '')
+    parser.close()
     
     questions = []
-    question_pattern = r'<div class="question">(.*?)</div>'
-    matches = re.findall(question_pattern, html_content, re.DOTALL)
-    
-    for idx, match in enumerate(matches):
-        questions.append({
-            'id': idx + 1,
-            'content': match.strip()
-        })
-    
-    return questions
\ No newline at end of file
+    for q in parser.questions:
+        q['content'] = ' '.join(''.join(q['content']).split())
+        questions.append(q)
+    return questions
+
+def store_question_bank(page_id, study):
+    """Index the questions and answers of a structured study page under `page_id`."""
+    key = answer_key(study)
+    prompts = [('mcq', q['question']) for q in study['mcq']]
+    prompts += [('true_false', q['statement']) for q in study['true_false']]
+    prompts += [('fill_in', q['prompt']) for q in study['fill_in']]
+    _store_questions(page_id, [
+        (f"q{i + 1}", kind, prompt, key[f"q{i + 1}"]) for i, (kind, prompt) in enumerate(prompts)
+    ])
+
+def store_question_bank_from_html(page_id, html_content):
+    """
+    Index the questions of an LLM-written page. Their answers live in the
+    page's own JavaScript, so these questions are stored without a key and
+    are not gradable server-side.
+    """
+    _store_questions(page_id, [
+        (q['field'] or f"q{q['id']}", 'html', q['content'], None) for q in parse_quiz_html(html_content)
+    ])
+
+def _store_questions(page_id, rows):
+    conn = get_db_connection()
+    with conn:
+        conn.execute('DELETE FROM quiz_questions WHERE page_id = ?', (page_id,))
+        conn.executemany(
+            'INSERT INTO quiz_questions (page_id, qid, kind, prompt, answer) VALUES (?, ?, ?, ?, ?)',
+            [(page_id,) + row for row in rows]
+        )
+
+def get_answer_key(page_id):
+    """{question_id: answer} for the gradable questions of a page."""
+    conn = get_db_connection()
+    rows = conn.execute(
+        'SELECT qid, answer FROM quiz_questions WHERE page_id = ? AND answer IS NOT NULL',
+        (page_id,)
+    ).fetchall()
+    return {row['qid']: row['answer'] for row in rows}
+
+def answer_key(study):
+    """
+    Map the question ids used by the study page template (q1, q2, ... in
+    MCQ, true/false, fill-in order) to normalized correct answers.
+    """
+    answers = {}
+    for q in study['mcq']:
+        answers[f"q{len(answers) + 1}"] = str(q['answer'])
+    for q in study['true_false']:
+        answers[f"q{len(answers) + 1}"] = 'true' if q['answer'] else 'false'
+    for q in study['fill_in']:
+        answers[f"q{len(answers) + 1}"] = q['answer'].strip().lower()
+    return answers
+
+def render_study_page(study, page_id=None):
+    """
+    Render validated study data (see ai_utils.validate_study_data) as a
+    standalone HTML page. Answers are not embedded; the quiz form posts to
+    /submit_quiz and is graded against the question bank for `page_id`.
+    """
+    return _env.get_template('ai_tool/study_page.html').render(study=study, page_id=page_id)
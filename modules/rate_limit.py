@@ -0,0 +1,118 @@
+import math
+import time
+from config import get_setting
+from modules.db_utils import get_db_connection
+from modules.metrics import inc
+
+
+class RateLimitedError(Exception):
+    """A request over its budget; `retry_after` is the seconds until it would fit."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Rate limited, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+def _level(conn, key, per_minute, burst, now):
+    """A bucket's current level: refilled at `per_minute` since its last update, up to `burst`."""
+    row = conn.execute('SELECT tokens, updated_at FROM rate_buckets WHERE key = ?', (key,)).fetchone()
+    if row is None:
+        return burst
+    return min(burst, row['tokens'] + (now - row['updated_at']) * per_minute / 60)
+
+
+def _take(conn, buckets, now):
+    """
+    Take `amount` from every (key, amount, per_minute, burst) bucket, or
+    from none of them. Buckets live in the rate_buckets table so all server
+    processes share them. Returns 0, or the seconds until all would fit.
+    Must run inside a write transaction.
+    """
+    levels = []
+    wait = 0.0
+    for key, amount, per_minute, burst in buckets:
+        if not per_minute:
+            continue  # unlimited
+        level = _level(conn, key, per_minute, burst, now)
+        # A request bigger than the whole burst waits for a full bucket rather than forever
+        amount = min(amount, burst)
+        if level < amount:
+            wait = max(wait, (amount - level) / (per_minute / 60))
+        levels.append((key, level - amount))
+    if wait:
+        return wait
+    conn.executemany(
+        'INSERT OR REPLACE INTO rate_buckets (key, tokens, updated_at) VALUES (?, ?, ?)',
+        [(key, level, now) for key, level in levels]
+    )
+    return 0.0
+
+
+def admit(user_id):
+    """
+    Charge one /process request to the user's request bucket, before
+    anything is stored for it. Raises RateLimitedError (charging nothing)
+    when that bucket is empty or the user's token bucket is still in debt
+    from earlier generations (see charge_tokens).
+    """
+    conn = get_db_connection()
+    with conn:
+        conn.execute('BEGIN IMMEDIATE')
+        now = time.time()
+        wait = 0.0
+        per_minute = get_setting('USER_TOKENS_PER_MINUTE')
+        if per_minute:
+            level = _level(conn, f'user:{user_id}:tokens', per_minute, get_setting('USER_TOKEN_BURST'), now)
+            if level < 0:
+                wait = -level / (per_minute / 60)
+        if not wait:
+            wait = _take(conn, [
+                (f'user:{user_id}:requests', 1, get_setting('USER_REQUESTS_PER_MINUTE'),
+                 get_setting('USER_REQUEST_BURST')),
+            ], now)
+    if wait:
+        inc('rate_limited_total', scope='user')
+        raise RateLimitedError(math.ceil(wait))
+
+
+def charge_tokens(user_id, tokens):
+    """
+    Charge `tokens` prompt tokens to the user's token bucket once a job
+    really calls the LLM (cache hits and coalesced jobs are free). The
+    bucket may go into debt; admit turns the user away until it is repaid.
+    """
+    per_minute = get_setting('USER_TOKENS_PER_MINUTE')
+    burst = get_setting('USER_TOKEN_BURST')
+    if not per_minute or not tokens:
+        return
+    key = f'user:{user_id}:tokens'
+    conn = get_db_connection()
+    with conn:
+        conn.execute('BEGIN IMMEDIATE')
+        now = time.time()
+        level = _level(conn, key, per_minute, burst, now)
+        conn.execute('INSERT OR REPLACE INTO rate_buckets (key, tokens, updated_at) VALUES (?, ?, ?)',
+                     (key, level - min(tokens, burst), now))
+
+
+def acquire_llm_budget(tokens):
+    """
+    Seconds to wait before an LLM request of about `tokens` prompt tokens
+    fits the global budget; 0 means it was charged and may go now.
+    Callers sleep and ask again. Every request sent counts, retries and
+    hedges included.
+    """
+    requests_per_minute = get_setting('LLM_REQUESTS_PER_MINUTE')
+    tokens_per_minute = get_setting('LLM_TOKENS_PER_MINUTE')
+    if not (requests_per_minute or tokens_per_minute):
+        return 0.0
+    conn = get_db_connection()
+    with conn:
+        conn.execute('BEGIN IMMEDIATE')
+        wait = _take(conn, [
+            ('llm:requests', 1, requests_per_minute, requests_per_minute),
+            ('llm:tokens', tokens, tokens_per_minute, tokens_per_minute),
+        ], time.time())
+    if wait:
+        inc('rate_limited_total', scope='global')
+    return wait
@@ -0,0 +1,243 @@
+import hashlib
+import html
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from html.parser import HTMLParser
+from modules.db_utils import get_db_connection
+from modules.pdf_utils import iter_pdf_pages
+
+# Seconds between background passes over the course material
+SEARCH_INDEX_INTERVAL = int(os.getenv("SEARCH_INDEX_INTERVAL", 300))
+# Sub-folders of data/<subject>/ that are indexed, and the kind recorded for each
+MATERIAL_KINDS = ('lectures', 'labs', 'summaries')
+SEARCH_LIMIT = 20
+# service_leases row naming the one server process that runs the background passes
+INDEXER_LEASE = 'search-indexer'
+
+logger = logging.getLogger(__name__)
+
+_indexer = None
+_indexer_lock = threading.Lock()
+
+
+class _SectionParser(HTMLParser):
+    """Visible text of an HTML summary, split into sections at each heading."""
+
+    HEADINGS = ('h1', 'h2', 'h3')
+    SKIP = ('script', 'style', 'head', 'title')
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.sections = [[]]
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self._skip += 1
+        elif tag in self.HEADINGS and any(part.strip() for part in self.sections[-1]):
+            self.sections.append([])
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP and self._skip:
+            self._skip -= 1
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.sections[-1].append(data)
+
+
+def _html_sections(path):
+    with open(path, encoding='utf-8', errors='replace') as f:
+        parser = _SectionParser()
+        parser.feed(f.read())
+        parser.close()
+    return [re.sub(r'\s+', ' ', "".join(parts)).strip() for parts in parser.sections]
+
+
+def _file_pages(path):
+    """Text of each page (PDF) or section (HTML) of a file."""
+    if path.lower().endswith('.pdf'):
+        return list(iter_pdf_pages(path))
+    return _html_sections(path)
+
+
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def index_file(path, subject, kind):
+    """
+    Bring one file's rows in the index up to date. Files whose mtime and
+    size are unchanged are not opened; files that were touched but whose
+    contents hash the same are not re-extracted.
+    Returns True if the file was (re)indexed.
+    """
+    st = os.stat(path)
+    conn = get_db_connection()
+    row = conn.execute(
+        'SELECT mtime, size, sha256 FROM search_files WHERE path = ?', (path,)
+    ).fetchone()
+    if row and row['mtime'] == st.st_mtime and row['size'] == st.st_size:
+        return False
+
+    sha = _sha256(path)
+    if row and row['sha256'] == sha:
+        with conn:
+            conn.execute('UPDATE search_files SET mtime = ?, size = ? WHERE path = ?',
+                         (st.st_mtime, st.st_size, path))
+        return False
+
+    rows = []
+    offset = 0
+    for number, text in enumerate(_file_pages(path), start=1):
+        if text.strip():
+            rows.append((text, path, subject, kind, number, offset))
+        offset += len(text)
+
+    with conn:
+        conn.execute('DELETE FROM search_pages WHERE path = ?', (path,))
+        conn.executemany(
+            'INSERT INTO search_pages (text, path, subject, kind, page, start_offset) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            rows
+        )
+        conn.execute(
+            'INSERT OR REPLACE INTO search_files (path, subject, kind, mtime, size, sha256, indexed_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (path, subject, kind, st.st_mtime, st.st_size, sha, time.time())
+        )
+    return True
+
+
+def _material_files(data_folder):
+    """
+    Yield (path, subject, kind) for every indexable file. Uploads are not
+    indexed: they have no subject to be searched under, and are shared by
+    content hash rather than owned by one user.
+    """
+    # Absolute paths, so the CLI and the server agree on each file's key
+    data_folder = data_folder and os.path.abspath(data_folder)
+    if data_folder and os.path.isdir(data_folder):
+        for subject in sorted(os.listdir(data_folder)):
+            for kind in MATERIAL_KINDS:
+                folder = os.path.join(data_folder, subject, kind)
+                if not os.path.isdir(folder):
+                    continue
+                for name in sorted(os.listdir(folder)):
+                    if name.lower().endswith(('.pdf', '.html', '.htm')):
+                        yield os.path.join(folder, name), subject, kind
+
+
+def index_materials(data_folder):
+    """
+    One incremental pass: index new and changed files, and drop the rows
+    of files that no longer exist. Returns counts of what was done.
+    """
+    counts = {'indexed': 0, 'unchanged': 0, 'failed': 0, 'removed': 0}
+    seen = set()
+    for path, subject, kind in _material_files(data_folder):
+        seen.add(path)
+        try:
+            counts['indexed' if index_file(path, subject, kind) else 'unchanged'] += 1
+        except Exception:
+            # A corrupt or half-written file must not stop the rest of the pass
+            logger.exception("Could not index %s", path)
+            counts['failed'] += 1
+
+    conn = get_db_connection()
+    gone = [row['path'] for row in conn.execute('SELECT path FROM search_files')
+            if row['path'] not in seen]
+    with conn:
+        conn.executemany('DELETE FROM search_pages WHERE path = ?', [(p,) for p in gone])
+        conn.executemany('DELETE FROM search_files WHERE path = ?', [(p,) for p in gone])
+    counts['removed'] = len(gone)
+    return counts
+
+
+def _hold_lease(holder, seconds):
+    """
+    Take or renew the indexer lease for `holder` unless another live
+    holder has it. Returns whether `holder` now holds it.
+    """
+    now = time.time()
+    conn = get_db_connection()
+    with conn:
+        conn.execute('DELETE FROM service_leases WHERE name = ? AND expires_at < ?', (INDEXER_LEASE, now))
+        conn.execute('INSERT OR IGNORE INTO service_leases (name, holder, expires_at) VALUES (?, ?, ?)',
+                     (INDEXER_LEASE, holder, now + seconds))
+        cursor = conn.execute('UPDATE service_leases SET expires_at = ? WHERE name = ? AND holder = ?',
+                              (now + seconds, INDEXER_LEASE, holder))
+    return bool(cursor.rowcount)
+
+
+def start_indexer(data_folder, interval=SEARCH_INDEX_INTERVAL):
+    """
+    Run index_materials now and every `interval` seconds on a daemon
+    thread. Started on first use in each (forked) server process; later
+    calls are no-ops. Only the process holding the indexer lease indexes,
+    so a deployment makes one pass per interval however many processes
+    it runs; the others take over if the holder stops renewing.
+    """
+    global _indexer
+    with _indexer_lock:
+        if _indexer is not None and _indexer[0] == os.getpid():
+            return
+
+        holder = uuid.uuid4().hex
+
+        def run():
+            while True:
+                try:
+                    if _hold_lease(holder, 2 * interval):
+                        index_materials(data_folder)
+                except Exception:
+                    logger.exception("Search indexing pass failed")
+                time.sleep(interval)
+
+        thread = threading.Thread(target=run, name="search-indexer", daemon=True)
+        thread.start()
+        _indexer = (os.getpid(), thread)
+
+
+def _match_expression(query):
+    """Turn free text into a safe FTS5 query: all words, the last one as a prefix."""
+    words = re.findall(r'\w+', query or '')
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return " ".join(terms)
+
+
+def search(subject, query, limit=SEARCH_LIMIT):
+    """
+    Best-ranked (BM25) pages of `subject` matching `query`. Each result has
+    the file name, kind, page number, the page's character offset in the
+    file's text and an HTML-escaped snippet with <mark>ed matches.
+    """
+    expression = _match_expression(query)
+    if expression is None:
+        return []
+    conn = get_db_connection()
+    rows = conn.execute(
+        "SELECT path, kind, page, start_offset, "
+        "snippet(search_pages, 0, char(2), char(3), '…', 16) AS snippet "
+        "FROM search_pages WHERE search_pages MATCH ? AND subject = ? "
+        "ORDER BY bm25(search_pages) LIMIT ?",
+        (f"text : ({expression})", subject, limit)
+    ).fetchall()
+    return [{
+        'name': os.path.basename(row['path']),
+        'kind': row['kind'],
+        'page': row['page'],
+        'offset': row['start_offset'],
+        'snippet': html.escape(row['snippet']).replace('\x02', '<mark>').replace('\x03', '</mark>'),
+    } for row in rows]
@@ -0,0 +1,125 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from modules.db_utils import get_db_connection
+from modules.cache_utils import get_cached_page
+from modules.metrics import inc
+
+# How long a generation lease lasts without renewal; the holder renews it every third of this
+GENERATION_LEASE_SECONDS = int(os.getenv("GENERATION_LEASE_SECONDS", 90))
+LEASE_POLL_SECONDS = 0.5
+
+logger = logging.getLogger(__name__)
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def single_flight(key, folder, func):
+    """
+    Run `func()` (which must return (filename, outcome) and cache a clean
+    page under `key`) at most once at a time per key.
+    Threads of this process asking for a key already in flight wait on the
+    leader's future and get its result. Other processes are held off by a
+    lease in SQLite: they wait for the lease to go away and then take the
+    page from the cache as (filename, 'cached'), or run `func` themselves if
+    the holder produced nothing cacheable.
+    """
+    with _inflight_lock:
+        future = _inflight.get(key)
+        leader = future is None
+        if leader:
+            future = _inflight[key] = Future()
+    if not leader:
+        inc('generation_coalesced_total', scope='thread')
+        return future.result()
+
+    try:
+        result = _run_with_lease(key, folder, func)
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            del _inflight[key]
+
+
+def _run_with_lease(key, folder, func):
+    waited = False
+    while True:
+        lease_id = _acquire(key)
+        if lease_id is not None:
+            if waited:
+                # The previous holder may have finished after all
+                cached = get_cached_page(key, folder)
+                if cached:
+                    _release(key, lease_id)
+                    return cached, 'cached'
+            return _run_leased(key, lease_id, func)
+
+        if not waited:
+            inc('generation_coalesced_total', scope='process')
+            waited = True
+        while _lease_held(key):
+            time.sleep(LEASE_POLL_SECONDS)
+        cached = get_cached_page(key, folder)
+        if cached:
+            return cached, 'cached'
+        # The holder failed or died without a cacheable page: try to take over
+
+
+def _run_leased(key, lease_id, func):
+    done = threading.Event()
+
+    def renew():
+        while not done.wait(GENERATION_LEASE_SECONDS / 3):
+            try:
+                conn = get_db_connection()
+                with conn:
+                    conn.execute(
+                        'UPDATE generation_leases SET expires_at = ? WHERE cache_key = ? AND lease_id = ?',
+                        (time.time() + GENERATION_LEASE_SECONDS, key, lease_id)
+                    )
+            except Exception:
+                logger.exception("Could not renew the generation lease for %s", key)
+
+    renewer = threading.Thread(target=renew, name="lease-renewer", daemon=True)
+    renewer.start()
+    try:
+        return func()
+    finally:
+        done.set()
+        _release(key, lease_id)
+
+
+def _acquire(key):
+    """Take the lease for `key` unless a live one exists. Returns the lease id or None."""
+    now = time.time()
+    lease_id = uuid.uuid4().hex
+    conn = get_db_connection()
+    with conn:
+        conn.execute('DELETE FROM generation_leases WHERE cache_key = ? AND expires_at < ?', (key, now))
+        cursor = conn.execute(
+            'INSERT OR IGNORE INTO generation_leases (cache_key, lease_id, expires_at) VALUES (?, ?, ?)',
+            (key, lease_id, now + GENERATION_LEASE_SECONDS)
+        )
+    return lease_id if cursor.rowcount else None
+
+
+def _lease_held(key):
+    conn = get_db_connection()
+    row = conn.execute(
+        'SELECT 1 FROM generation_leases WHERE cache_key = ? AND expires_at >= ?', (key, time.time())
+    ).fetchone()
+    return row is not None
+
+
+def _release(key, lease_id):
+    conn = get_db_connection()
+    with conn:
+        conn.execute('DELETE FROM generation_leases WHERE cache_key = ? AND lease_id = ?', (key, lease_id))
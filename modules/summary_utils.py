@@ -0,0 +1,128 @@
+import asyncio
+import os
+from config import get_setting
+from modules.ai_utils import (
+    DEEPSEEK_MODEL, MAX_INPUT_CHARS,
+    AIServiceError, generate_study_html, generate_study_data, llm_error_to_service_error,
+)
+from modules.llm_client import achat_completion, create_async_session, LLMError
+from modules.pdf_utils import CHARS_PER_TOKEN
+from modules.prompt_compaction import PROMPT_COMPACTION, compact_text
+from modules.metrics import inc, stage
+
+CHUNK_TOKENS = int(os.getenv("AI_CHUNK_TOKENS", 1500))
+CHUNK_CHARS = CHUNK_TOKENS * CHARS_PER_TOKEN
+# Caps the number of map calls (and so the cost) for very long documents
+MAX_CHUNKS = int(os.getenv("AI_MAX_CHUNKS", 24))
+MAX_DOCUMENT_CHARS = CHUNK_CHARS * MAX_CHUNKS
+MAP_CONCURRENCY = int(os.getenv("AI_MAP_CONCURRENCY", 8))
+# Size of the combined chunk notes handed to the final study-page call
+REDUCE_INPUT_CHARS = 12000
+# Documents up to this size (after compaction) skip the map step: their most
+# salient sentences are cut down to one MAX_INPUT_CHARS prompt instead
+DIRECT_INPUT_CHARS = int(os.getenv("AI_DIRECT_INPUT_CHARS", MAX_INPUT_CHARS * 2))
+
+
+def chunk_text(text, max_chars=CHUNK_CHARS):
+    """
+    Split text into chunks of at most `max_chars`, breaking on paragraph
+    and line boundaries where possible.
+    """
+    chunks = []
+    current = []
+    size = 0
+    for line in (text or "").splitlines(keepends=True):
+        while len(line) > max_chars:
+            # A single huge line (no newlines in the PDF) gets hard-split
+            if current:
+                chunks.append("".join(current))
+                current, size = [], 0
+            chunks.append(line[:max_chars])
+            line = line[max_chars:]
+        if size + len(line) > max_chars and current:
+            chunks.append("".join(current))
+            current, size = [], 0
+        current.append(line)
+        size += len(line)
+    if current:
+        chunks.append("".join(current))
+    return [c for c in chunks if c.strip()]
+
+
+def _map_prompt(chunk, index, total, max_words):
+    return f"""
+You are preparing study notes from part {index} of {total} of a lecture document.
+Write concise plain-text notes (at most {max_words} words) covering the key
+definitions, facts, formulas and examples in this part. No HTML, no markdown
+headings, no preamble.
+
+PART {index} OF {total}:
+{chunk}
+"""
+
+
+async def _summarize_chunk(http, semaphore, chunk, index, total, max_words):
+    messages = [{"role": "user", "content": _map_prompt(chunk, index, total, max_words)}]
+    async with semaphore:
+        data = await achat_completion(http, messages, model=DEEPSEEK_MODEL, temperature=0.2)
+    return (data.get("choices", [{}])[0].get("message", {}).get("content") or "").strip()
+
+
+async def summarize_chunks(chunks, concurrency=MAP_CONCURRENCY):
+    """
+    Summarize all chunks concurrently (at most `concurrency` requests in
+    flight). Returns the notes in document order.
+    """
+    total = len(chunks)
+    max_words = max(60, REDUCE_INPUT_CHARS // total // 6)
+    semaphore = asyncio.Semaphore(concurrency)
+    async with create_async_session(concurrency) as http:
+        return await asyncio.gather(*(
+            _summarize_chunk(http, semaphore, chunk, i + 1, total, max_words)
+            for i, chunk in enumerate(chunks)
+        ))
+
+
+def _prepare_document(text):
+    """
+    Map step for long documents: returns the (text, max_chars) to hand to
+    the final study-page call. The text is compacted first (boilerplate
+    dropped, see compact_text); what is still well over one prompt is split
+    into chunks and summarized concurrently.
+    """
+    raw = (text or "")[:MAX_DOCUMENT_CHARS]
+    with stage('compact'):
+        text = compact_text(raw, MAX_DOCUMENT_CHARS)
+    inc('prompt_compaction_tokens_total', len(raw) // CHARS_PER_TOKEN, stage='before')
+    inc('prompt_compaction_tokens_total', len(text) // CHARS_PER_TOKEN, stage='after')
+    if len(text) <= (DIRECT_INPUT_CHARS if PROMPT_COMPACTION else MAX_INPUT_CHARS):
+        return text, MAX_INPUT_CHARS
+    if not get_setting('DEEPSEEK_API_KEY'):
+        raise AIServiceError("DeepSeek API key is not configured. Please set DEEPSEEK_API_KEY in your .env file.")
+
+    chunks = chunk_text(text)
+    try:
+        notes = asyncio.run(summarize_chunks(chunks))
+    except LLMError as e:
+        raise llm_error_to_service_error(e)
+
+    combined = "\n\n".join(
+        f"[Part {i + 1}/{len(notes)}]\n{note}" for i, note in enumerate(notes)
+    )
+    return combined, REDUCE_INPUT_CHARS
+
+
+def generate_document_html(text, on_delta=None):
+    """
+    Build a study page from a document of any length. Short inputs go
+    straight to generate_study_html; longer ones are split into chunks,
+    summarized concurrently (map) and the combined notes are turned into
+    the study page (reduce). Raises AIServiceError like generate_study_html.
+    The final call streams into `on_delta` when one is given.
+    """
+    return generate_study_html(*_prepare_document(text), on_delta=on_delta)
+
+
+def generate_document_data(text, on_delta=None):
+    """Like generate_document_html, but returns the validated study data (JSON mode)."""
+    return generate_study_data(*_prepare_document(text), on_delta=on_delta)
@@ -0,0 +1,114 @@
+import hashlib
+import os
+import tempfile
+import time
+from modules.db_utils import get_db_connection
+from modules.pdf_utils import extract_text_from_pdf
+from modules.metrics import inc
+
+CHUNK_SIZE = 64 * 1024
+PDF_MAGIC = b'%PDF-'
+
+
+class UploadError(Exception):
+    """The upload was rejected; the message is safe to show to the user."""
+
+
+def _read_head(stream, size):
+    head = b''
+    while len(head) < size:
+        chunk = stream.read(size - len(head))
+        if not chunk:
+            break
+        head += chunk
+    return head
+
+
+def save_upload(file_storage, folder, max_size=None):
+    """
+    Stream an uploaded PDF into `folder` under the SHA-256 of its contents,
+    hashing while writing in CHUNK_SIZE pieces so memory use does not depend
+    on the file size. The magic bytes are checked before anything is written
+    and UploadError is raised for non-PDFs or files over `max_size` bytes.
+    If that content is already stored, the new copy is discarded.
+    Returns (digest, path).
+    """
+    stream = file_storage.stream
+    head = _read_head(stream, len(PDF_MAGIC))
+    if head != PDF_MAGIC:
+        raise UploadError("Only PDF files can be uploaded.")
+
+    os.makedirs(folder, exist_ok=True)
+    digest = hashlib.sha256(head)
+    written = len(head)
+    fd, tmp_path = tempfile.mkstemp(dir=folder, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            out.write(head)
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if max_size is not None and written > max_size:
+                    raise UploadError(f"File is too large (limit {max_size // (1024 * 1024)} MB).")
+                digest.update(chunk)
+                out.write(chunk)
+
+        sha = digest.hexdigest()
+        path = os.path.join(folder, f"{sha}.pdf")
+        if os.path.exists(path):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, path)
+        return sha, path
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def extract_upload_text(path, max_chars=None):
+    """
+    extract_text_from_pdf for a file written by save_upload, memoized in the
+    pdf_texts table by content hash. A stored extraction is reused when it
+    was made with at least the requested budget.
+    """
+    text = stored_upload_text(path, max_chars)
+    if text is not None:
+        inc('extraction_cache_total', result='hit')
+        return text
+
+    inc('extraction_cache_total', result='miss')
+    sha = os.path.splitext(os.path.basename(path))[0]
+    text = extract_text_from_pdf(path, max_chars=max_chars)
+    conn = get_db_connection()
+    with conn:
+        conn.execute(
+            'INSERT OR REPLACE INTO pdf_texts (sha256, text, max_chars, created_at) VALUES (?, ?, ?, ?)',
+            (sha, text, max_chars, time.time())
+        )
+    return text
+
+
+def stored_upload_text(path, max_chars=None):
+    """
+    The stored extraction of an upload if one was made with at least
+    `max_chars`, else None. Never reads the PDF.
+    """
+    sha = os.path.splitext(os.path.basename(path))[0]
+    conn = get_db_connection()
+    row = conn.execute(
+        'SELECT text, max_chars FROM pdf_texts WHERE sha256 = ?', (sha,)
+    ).fetchone()
+    if row and (row['max_chars'] is None or (max_chars is not None and row['max_chars'] >= max_chars)):
+        return row['text'] if max_chars is None else row['text'][:max_chars]
+    return None
+
+
+def stored_text_length(path):
+    """Characters of the stored extraction of an upload, or None if it was never extracted."""
+    sha = os.path.splitext(os.path.basename(path))[0]
+    conn = get_db_connection()
+    row = conn.execute('SELECT length(text) AS chars FROM pdf_texts WHERE sha256 = ?', (sha,)).fetchone()
+    return None if row is None else row['chars']
@@ -0,0 +1,35 @@
+import unittest
+from modules.job_queue import FairQueue
+
+
+class FairQueueTest(unittest.TestCase):
+    """Deficit round robin between users, by estimated prompt tokens."""
+
+    def test_jobs_larger_than_a_quantum(self):
+        q = FairQueue(maxsize=20, quantum=100)
+        for i in range(3):
+            q.put_nowait('heavy', ('heavy', i), cost=250)
+        for i in range(6):
+            q.put_nowait('light', ('light', i), cost=100)
+        order = [q.get() for _ in range(9)]
+        # A 250-token job saves up credit for three turns while the light user is served
+        # once per turn, so each gets about the same tokens and neither starves
+        self.assertEqual(order, [('light', 0), ('light', 1), ('heavy', 0),
+                                 ('light', 2), ('light', 3), ('heavy', 1),
+                                 ('light', 4), ('light', 5), ('heavy', 2)])
+        self.assertEqual(q.qsize(), 0)
+        self.assertEqual(q.users(), 0)
+
+    def test_credit_is_not_banked_while_idle(self):
+        q = FairQueue(maxsize=20, quantum=100)
+        q.put_nowait('a', 'a0', cost=10)
+        self.assertEqual(q.get(), 'a0')
+        # 'a' left with 90 unused credit, which must not let it jump ahead of 'b' now
+        q.put_nowait('b', 'b0', cost=100)
+        q.put_nowait('a', 'a1', cost=100)
+        q.put_nowait('a', 'a2', cost=100)
+        self.assertEqual([q.get() for _ in range(3)], ['b0', 'a1', 'a2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
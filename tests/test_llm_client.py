@@ -0,0 +1,173 @@
+import json
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from benchmarks.fake_deepseek import start_server
+from modules import llm_client
+
+MESSAGES = [{"role": "user", "content": "Create study material. CONTENT: binary search trees"}]
+
+
+class HedgedTrialTest(unittest.TestCase):
+    """A half-open provider whose trial request loses a hedge must not stay locked out."""
+
+    def setUp(self):
+        self.servers = []
+        primary = self._provider('primary', latency=0.05, slow_rate=1.0, slow_latency=1.0)
+        alternate = self._provider('alternate', latency=0.05)
+        self._saved = (llm_client._providers, llm_client.LLM_HEDGE, llm_client.LLM_HEDGE_DELAY)
+        llm_client._providers = [primary, alternate]
+        llm_client.LLM_HEDGE = True
+        llm_client.LLM_HEDGE_DELAY = 0.1
+        # Half-open: opened long enough ago that the next call is the trial
+        primary.breaker.opened_at = time.monotonic() - primary.breaker.reset_after
+        self.primary = primary
+
+    def tearDown(self):
+        llm_client._providers, llm_client.LLM_HEDGE, llm_client.LLM_HEDGE_DELAY = self._saved
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+    def _provider(self, name, **options):
+        server, url = start_server(jitter=0, first_token=0.01, **options)
+        self.servers.append(server)
+        return llm_client.Provider(name, url, 'test')
+
+    def _wait_for_loser(self):
+        deadline = time.monotonic() + 5
+        while self.primary.breaker.trial_running and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def test_cancelled_trial_is_released(self):
+        llm_client.chat_completion(MESSAGES, model="deepseek-chat", temperature=0.4)
+        self._wait_for_loser()
+        self.assertEqual(self.primary.breaker.state, 'half_open')
+        self.assertTrue(self.primary.breaker.allow())
+
+    def test_cancelled_streamed_trial_is_released(self):
+        llm_client.stream_chat_completion(MESSAGES, "deepseek-chat", 0.4, lambda text: None)
+        self._wait_for_loser()
+        self.assertTrue(self.primary.breaker.allow())
+
+
+class MalformedHandler(BaseHTTPRequestHandler):
+    """Answers 200 with a body the client cannot use: a JSON list, or a non-object stream event."""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)))
+        body = b'data: 1\n\ndata: [DONE]\n\n' if request.get('stream') else b'[1]'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MalformedResponseTest(unittest.TestCase):
+    """A provider thread that fails unexpectedly must still end the call, with an LLMError."""
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), MalformedHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self._saved = llm_client._providers
+        self.provider = llm_client.Provider('malformed', f"http://127.0.0.1:{self.server.server_port}", 'test')
+        llm_client._providers = [self.provider]
+
+    def tearDown(self):
+        llm_client._providers = self._saved
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _call_with_deadline(self, call):
+        outcome = []
+
+        def target():
+            try:
+                call()
+            except llm_client.LLMError as e:
+                outcome.append(e)
+
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        thread.join(10)
+        self.assertFalse(thread.is_alive(), "the call never returned")
+        self.assertEqual(len(outcome), 1)
+
+    def test_malformed_body(self):
+        self._call_with_deadline(lambda: llm_client.chat_completion(MESSAGES, model="deepseek-chat", temperature=0.4))
+
+    def test_malformed_stream_event(self):
+        self._call_with_deadline(
+            lambda: llm_client.stream_chat_completion(MESSAGES, "deepseek-chat", 0.4, lambda text: None))
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """Answers 503 to every other request and a normal completion to the rest."""
+    requests = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        FlakyHandler.requests += 1
+        if FlakyHandler.requests % 2:
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = json.dumps({"choices": [{"message": {"role": "assistant", "content": "ok"}}],
+                           "usage": {"prompt_tokens": 10, "completion_tokens": 1}}).encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class BudgetPerAttemptTest(unittest.TestCase):
+    """The global LLM budget is charged for every request sent, not once per call."""
+
+    def setUp(self):
+        self.servers = []
+        self.charges = []
+        self._saved = (llm_client._providers, llm_client.LLM_HEDGE, llm_client.LLM_HEDGE_DELAY,
+                       llm_client.LLM_BACKOFF_BASE, llm_client.acquire_llm_budget)
+        llm_client.LLM_BACKOFF_BASE = 0.01
+        llm_client.acquire_llm_budget = lambda tokens: self.charges.append(tokens) or 0
+
+    def tearDown(self):
+        (llm_client._providers, llm_client.LLM_HEDGE, llm_client.LLM_HEDGE_DELAY,
+         llm_client.LLM_BACKOFF_BASE, llm_client.acquire_llm_budget) = self._saved
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+    def test_retry_is_charged(self):
+        FlakyHandler.requests = 0
+        server = ThreadingHTTPServer(('127.0.0.1', 0), FlakyHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.servers.append(server)
+        llm_client._providers = [llm_client.Provider('flaky', f"http://127.0.0.1:{server.server_port}", 'test')]
+        llm_client.chat_completion(MESSAGES, model="deepseek-chat", temperature=0.4)
+        self.assertEqual(FlakyHandler.requests, 2)
+        self.assertEqual(len(self.charges), 2)
+
+    def test_hedge_is_charged(self):
+        providers = []
+        for name, options in (('slow', {'slow_rate': 1.0, 'slow_latency': 0.5}), ('fast', {})):
+            server, url = start_server(jitter=0, latency=0.05, first_token=0.01, **options)
+            self.servers.append(server)
+            providers.append(llm_client.Provider(name, url, 'test'))
+        llm_client._providers = providers
+        llm_client.LLM_HEDGE = True
+        llm_client.LLM_HEDGE_DELAY = 0.1
+        llm_client.chat_completion(MESSAGES, model="deepseek-chat", temperature=0.4)
+        self.assertEqual(len(self.charges), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import os
+import tempfile
+import time
+import unittest
+from app import create_app
+from modules import metrics
+from modules.db_utils import get_db_connection, close_db_connection
+from modules.rate_limit import admit, charge_tokens, RateLimitedError
+
+
+class TokenDebtTest(unittest.TestCase):
+    """A user whose generations overdrew the token bucket is turned away until it is repaid."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.app = create_app({'DATABASE_PATH': os.path.join(self.tmp.name, 'test.sqlite'),
+                               'USER_REQUESTS_PER_MINUTE': 600, 'USER_REQUEST_BURST': 100,
+                               'USER_TOKENS_PER_MINUTE': 600, 'USER_TOKEN_BURST': 1000})
+
+    def tearDown(self):
+        # Into this database while it still exists, not at exit
+        metrics.flush()
+        close_db_connection()
+        self.tmp.cleanup()
+
+    def _level(self, key):
+        row = get_db_connection().execute('SELECT tokens FROM rate_buckets WHERE key = ?', (key,)).fetchone()
+        return None if row is None else row['tokens']
+
+    def test_debt_blocks_admit(self):
+        admit(1)
+        requests_left = self._level('user:1:requests')
+        # Each charge is capped at the burst, so it takes two to go into debt
+        charge_tokens(1, 5000)
+        admit(1)
+        charge_tokens(1, 5000)
+        self.assertLess(self._level('user:1:tokens'), 0)
+
+        with self.assertRaises(RateLimitedError) as refused:
+            admit(1)
+        # 1000 tokens of debt at 10 tokens a second
+        self.assertAlmostEqual(refused.exception.retry_after, 100, delta=1)
+        # Refused requests are not charged
+        self.assertAlmostEqual(self._level('user:1:requests'), requests_left - 1, delta=0.1)
+        # Other users are unaffected
+        admit(2)
+
+    def test_admitted_again_once_repaid(self):
+        charge_tokens(1, 1000)
+        charge_tokens(1, 100)
+        with self.assertRaises(RateLimitedError):
+            admit(1)
+        # Ten seconds later the 100-token debt has been refilled
+        conn = get_db_connection()
+        with conn:
+            conn.execute('UPDATE rate_buckets SET updated_at = ? WHERE key = ?', (time.time() - 11, 'user:1:tokens'))
+        admit(1)
+
+
+if __name__ == '__main__':
+    unittest.main()
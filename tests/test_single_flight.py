@@ -0,0 +1,67 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from app import create_app
+from modules import metrics, single_flight
+from modules.db_utils import get_db_connection, close_db_connection
+
+
+class LeaseTakeoverTest(unittest.TestCase):
+    """A lease left behind by another process's generation must not block the key for good."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.folder = os.path.join(self.tmp.name, 'generated')
+        self.app = create_app({'DATABASE_PATH': os.path.join(self.tmp.name, 'test.sqlite'),
+                               'GENERATED_FOLDER': self.folder})
+        self._saved = single_flight.LEASE_POLL_SECONDS
+        single_flight.LEASE_POLL_SECONDS = 0.05
+        self.calls = []
+
+    def tearDown(self):
+        single_flight.LEASE_POLL_SECONDS = self._saved
+        # Into this database while it still exists, not at exit
+        metrics.flush()
+        close_db_connection()
+        self.tmp.cleanup()
+
+    def _hold(self, key, seconds):
+        """A lease as another process would hold it, without anyone renewing it."""
+        conn = get_db_connection()
+        with conn:
+            conn.execute('INSERT INTO generation_leases (cache_key, lease_id, expires_at) VALUES (?, ?, ?)',
+                         (key, 'other-process', time.time() + seconds))
+
+    def _generate(self):
+        self.calls.append(time.monotonic())
+        return 'page.html', 'generated'
+
+    def test_takes_over_after_holder_fails(self):
+        self._hold('failed-key', 60)
+
+        def fail():
+            # The holder gives up without caching a page, releasing its lease
+            time.sleep(0.2)
+            single_flight._release('failed-key', 'other-process')
+
+        threading.Thread(target=fail).start()
+        started = time.monotonic()
+        result = single_flight.single_flight('failed-key', self.folder, self._generate)
+        self.assertEqual(result, ('page.html', 'generated'))
+        self.assertEqual(len(self.calls), 1)
+        self.assertGreaterEqual(self.calls[0] - started, 0.2)
+        self.assertFalse(single_flight._lease_held('failed-key'))
+
+    def test_takes_over_after_holder_dies(self):
+        # A dead holder stops renewing: its lease runs out instead of being released
+        self._hold('dead-key', 0.3)
+        result = single_flight.single_flight('dead-key', self.folder, self._generate)
+        self.assertEqual(result, ('page.html', 'generated'))
+        self.assertEqual(len(self.calls), 1)
+        self.assertFalse(single_flight._lease_held('dead-key'))
+
+
+if __name__ == '__main__':
+    unittest.main()